@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import ssl
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from dump_streaming import JsonArrayWriter
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from new_guitar_parsing import parse_new_guitars
+from used_guitar_parsing import parse_used_guitars_old
+
+# Statuses worth retrying: rate limited or a server-side failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# How fetched pages are parsed when streamed straight into the parsers
+PARSERS = {
+    "new": parse_new_guitars,
+    "used": parse_used_guitars_old,
+    "used_other": parse_new_guitars,
+}
+
+
+class FetchError(Exception):
+    pass
+
+
+class HttpPool:
+    """
+    A minimal asyncio HTTP/1.1 client keeping up to `size` keep-alive connections to one host.
+    At most `size` requests are in flight at once; idle connections are reused by the next request.
+    """
+
+    def __init__(self, url, size=8, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == "https"
+        self.port = parts.port or (443 if self.tls else 80)
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle = deque()
+        self._ssl = ssl.create_default_context() if self.tls else None
+        self.opened = 0
+
+    async def _connect(self):
+        self.opened += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self._ssl)
+
+    async def request(self, method, path, body=b"", headers=None):
+        """Send one request and return (status, headers, body); the body is un-gzipped if needed."""
+        headers = headers or {}
+        async with self._slots:
+            if self._idle:
+                try:
+                    status, response_headers, payload = await self._send(self._idle.pop(), method, path, body, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # The server closed the idle keep-alive connection; retry once on a fresh one
+                    status, response_headers, payload = await self._send(await self._connect(), method, path, body, headers)
+            else:
+                status, response_headers, payload = await self._send(await self._connect(), method, path, body, headers)
+        if response_headers.get("content-encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        return status, response_headers, payload
+
+    async def _send(self, connection, method, path, body, headers):
+        reader, writer = connection
+        try:
+            response = await asyncio.wait_for(self._exchange(reader, writer, method, path, body, headers), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if response[1].get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append(connection)
+        return response
+
+    async def _exchange(self, reader, writer, method, path, body, headers):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", "Accept-Encoding: gzip",
+                 f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        head = await reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            payload = b"".join(chunks)
+        elif "content-length" in response_headers:
+            payload = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            payload = await reader.read()
+            response_headers["connection"] = "close"
+        return status, response_headers, payload
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart (no limit if rate is None)."""
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AlgoliaFetcher:
+    """
+    Fetches numbered pages of one Algolia index query through the multi-query endpoint, so every response has the
+    same {"results": [...]} shape as the hand-collected dumps. Failed requests are retried with exponential backoff
+    (honouring Retry-After); other errors raise FetchError.
+    """
+
+    def __init__(self, url, index, params="", app_id=None, api_key=None, hits_per_page=None,
+                 concurrency=8, rate=None, retries=5, backoff=0.5, timeout=30):
+        parts = urlsplit(url)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.index = index
+        # The page is set per request; an inherited hitsPerPage is kept (resumed pages must hold as many hits as
+        # the existing dumps) unless hits_per_page overrides it
+        replaced = ("page", "hitsPerPage") if hits_per_page else ("page",)
+        self.params = [(k, v) for k, v in parse_qsl(params, keep_blank_values=True) if k not in replaced]
+        if hits_per_page:
+            self.params.append(("hitsPerPage", str(hits_per_page)))
+        self.headers = {"Content-Type": "application/json"}
+        if app_id:
+            self.headers["X-Algolia-Application-Id"] = app_id
+        if api_key:
+            self.headers["X-Algolia-API-Key"] = api_key
+        self.concurrency = concurrency
+        self.pool = HttpPool(url, concurrency, timeout)
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+
+    def page_body(self, page):
+        params = urlencode(self.params + [("page", str(page))])
+        return json.dumps({"requests": [{"indexName": self.index, "params": params}]}).encode("utf-8")
+
+    async def fetch_page(self, page):
+        """The decoded response for one page."""
+        body = self.page_body(page)
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait()
+            try:
+                with METRICS.stage("fetch"):
+                    status, headers, payload = await self.pool.request("POST", self.path, body, self.headers)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                status, headers, error = None, {}, e
+            else:
+                if status == 200:
+                    METRICS.count("pages_fetched")
+                    return json.loads(payload)
+                error = f"HTTP {status}: {payload[:200].decode('utf-8', 'replace')}"
+                if status not in RETRY_STATUSES:
+                    raise FetchError(f"Page {page}: {error}")
+
+            if attempt == self.retries:
+                raise FetchError(f"Page {page} failed after {attempt + 1} attempts: {error}")
+            METRICS.count("retries")
+            retry_after = headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            await asyncio.sleep(delay)
+
+    async def iter_pages(self, pages):
+        """Yield (page, response) in page order while up to `concurrency` later pages are already in flight."""
+        pending = deque()
+        try:
+            for page in pages:
+                pending.append((page, asyncio.ensure_future(self.fetch_page(page))))
+                # Only a bounded window of pages is scheduled ahead of the one being consumed
+                if len(pending) > 2 * self.concurrency:
+                    page, task = pending.popleft()
+                    yield page, await task
+            while pending:
+                page, task = pending.popleft()
+                yield page, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    def close(self):
+        self.pool.close()
+
+
+def page_number(results):
+    return max(result.get("nbPages") or 0 for result in results)
+
+
+def dump_path(data_folder, prefix, page, first_page=0):
+    """Pages are numbered the way the hand-collected dumps are: <prefix>1.json holds first_page."""
+    return os.path.join(data_folder, f"{prefix}{page - first_page + 1}.json")
+
+
+def read_dump(path):
+    """A previously written dump, or None if it is missing or incomplete (so the page is fetched again)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and isinstance(data.get("results"), list) else None
+
+
+def write_dump(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def page_range(fetcher, data_folder, prefix, first_page=0, pages=None, resume=True):
+    """
+    The pages to collect: `pages` of them, or up to the index's nbPages read from the first page.
+    The first page comes from its dump only when resuming; otherwise it is fetched, since the index may have changed.
+    """
+    if pages is not None:
+        return range(first_page, first_page + pages), None
+    first = resume and read_dump(dump_path(data_folder, prefix, first_page, first_page))
+    if not first:
+        first = await fetcher.fetch_page(first_page)
+    return range(first_page, page_number(first["results"])), first
+
+
+async def fetch_dumps(fetcher, data_folder, prefix, first_page=0, pages=None, resume=True):
+    """
+    Write each page to data_folder/<prefix><n>.json in the dump format the parsers read.
+    With resume, pages whose dump is already complete on disk are not fetched again. Returns (written, skipped).
+    """
+    os.makedirs(data_folder, exist_ok=True)
+    page_numbers, first = await page_range(fetcher, data_folder, prefix, first_page, pages, resume)
+    todo = []
+    skipped = 0
+    for page in page_numbers:
+        path = dump_path(data_folder, prefix, page, first_page)
+        if resume and read_dump(path):
+            skipped += 1
+        elif first and page == first_page:
+            write_dump(path, first)
+        else:
+            todo.append(page)
+    written = len(page_numbers) - skipped - len(todo)
+    async for page, data in fetcher.iter_pages(todo):
+        write_dump(dump_path(data_folder, prefix, page, first_page), data)
+        written += 1
+    return written, skipped
+
+
+async def fetch_guitars(fetcher, kind, first_page=0, pages=None):
+    """Yield parsed guitars straight from the fetched pages, in page order, without writing any dumps."""
+    parse = PARSERS[kind]
+    if pages is None:
+        first = await fetcher.fetch_page(first_page)
+        for guitar in parse(first):
+            yield guitar
+        page_numbers = range(first_page + 1, page_number(first["results"]))
+    else:
+        page_numbers = range(first_page, first_page + pages)
+    async for _, data in fetcher.iter_pages(page_numbers):
+        for guitar in parse(data):
+            yield guitar
+
+
+def query_from_dump(path):
+    """Index name and query parameters of the first result in an existing dump, to repeat that query."""
+    result = read_dump(path)["results"][0]
+    return result.get("index"), result.get("params", "")
+
+
+async def main(args):
+    index, params = query_from_dump(args.like) if args.like else (None, "")
+    fetcher = AlgoliaFetcher(
+        args.url, args.index or index, args.params if args.params is not None else params,
+        app_id=args.app_id or os.environ.get("ALGOLIA_APP_ID"),
+        api_key=args.api_key or os.environ.get("ALGOLIA_API_KEY"),
+        hits_per_page=args.hits_per_page, concurrency=args.concurrency, rate=args.rate,
+        retries=args.retries, backoff=args.backoff, timeout=args.timeout
+    )
+    try:
+        if args.stream_to:
+            # Written beside the target and moved into place once complete, so a failed fetch leaves no partial file
+            with open(args.stream_to + ".tmp", "w", encoding="utf-8") as out_file:
+                writer = JsonArrayWriter(out_file)
+                async for guitar in fetch_guitars(fetcher, args.kind, args.first_page, args.pages):
+                    writer.write(guitar)
+                writer.close()
+            os.replace(args.stream_to + ".tmp", args.stream_to)
+            print(f"✅ Fetched and parsed {writer.count} {args.kind} guitars into {args.stream_to}")
+        else:
+            written, skipped = await fetch_dumps(fetcher, args.data_folder, args.prefix, args.first_page, args.pages,
+                                                 resume=not args.refetch)
+            print(f"✅ Wrote {written} page(s) to {args.data_folder}/{args.prefix}*.json, {skipped} already collected")
+        print(f"🔌 {fetcher.pool.opened} connection(s) opened")
+    finally:
+        fetcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch Algolia result pages into data/ dumps (or straight into the parsers).")
+    parser.add_argument("url", help="Multi-query endpoint, e.g. https://<APP>-dsn.algolia.net/1/indexes/*/queries "
+                                    "(or a local stand-in server)")
+    parser.add_argument("--like", metavar="DUMP", help="Repeat the index and query parameters of an existing dump")
+    parser.add_argument("--index", help="Index name (overrides --like)")
+    parser.add_argument("--params", help="Query parameters as an URL-encoded string (overrides --like); page is set per request")
+    parser.add_argument("--app-id", help="Algolia application ID (default: $ALGOLIA_APP_ID)")
+    parser.add_argument("--api-key", help="Algolia search API key (default: $ALGOLIA_API_KEY)")
+    parser.add_argument("--prefix", default="new_guitars",
+                        help="Dump file prefix: new_guitars, used_guitars or used_guitars_other")
+    parser.add_argument("--data-folder", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    parser.add_argument("--first-page", type=int, default=0, help="Page stored as <prefix>1.json")
+    parser.add_argument("--pages", type=int, help="Number of pages to collect (default: all, from nbPages)")
+    parser.add_argument("--hits-per-page", type=int,
+                        help="Override the hitsPerPage of --params / --like (resumed pages then no longer line up with old dumps)")
+    parser.add_argument("--refetch", action="store_true", help="Fetch pages again even if their dump already exists")
+    parser.add_argument("--stream-to", metavar="PATH",
+                        help="Parse pages as they arrive and write the parsed guitars to PATH instead of writing dumps")
+    parser.add_argument("--kind", choices=list(PARSERS), default="new", help="Parser used with --stream-to")
+    parser.add_argument("--concurrency", type=int, default=8, help="Pooled connections / requests in flight")
+    parser.add_argument("--rate", type=float, help="Maximum requests started per second")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=0.5, help="First retry delay in seconds, doubled per retry")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    try:
+        if not (args.like or args.index):
+            raise ValueError("give --index or --like DUMP")
+        asyncio.run(main(args))
+        finish_metrics(args)
+    except Exception as e:
+        print(f"❌ Error: {e}")
@@ -1,7 +1,18 @@
+import argparse
 import json
 import os
 import re
+from contextlib import nullcontext
+from functools import lru_cache
+import numpy as np
 from rapidfuzz import fuzz, process
+import catalog_db
+import columnar
+from deal_queries import TopK, in_window, price_of, select_top_matches
+from dedup import dedup_catalogs
+from listing import load_listings, to_cents
+from match_cache import MatchCache
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
 
 # List of common color-related words to remove from guitar titles
 COLOR_TERMS = {
@@ -24,6 +35,64 @@ MODEL_SERIES = [
     "dinky", "evh", "wolfgang", "rg", "s", "prestige", "jem"
 ]
 
+# MODEL_SERIES terms in normalized form (e.g. "c-1" -> "c1"), used as phrase keys for candidate blocking
+NORMALIZED_SERIES = sorted({re.sub(r'[^a-z0-9 ]', '', term) for term in MODEL_SERIES})
+
+class SeriesMatcher:
+    """
+    Aho-Corasick automaton over a list of terms, finding every term that occurs as a substring of a text in one pass.
+    Each term gets the bit of its position in the list, so a duplicated term sets (and counts) two bits.
+    """
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        goto = [{}]
+        out = [0]
+        for bit, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                if char not in goto[state]:
+                    goto.append({})
+                    out.append(0)
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            out[state] |= 1 << bit
+
+        # Breadth-first pass to link each state to its longest proper suffix that is also a trie state
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, child in goto[state].items():
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[child] = goto[suffix].get(char, 0) if state else 0
+                out[child] |= out[fail[child]]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def mask(self, text):
+        """Return the bitmask of terms occurring in text (case-sensitive; callers lowercase first)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found |= out[state]
+        return found
+
+SERIES_MATCHER = SeriesMatcher(MODEL_SERIES)
+
+@lru_cache(maxsize=65536)
+def series_mask(title):
+    """Bitmask of the MODEL_SERIES terms found in a title, computed once per distinct title."""
+    return SERIES_MATCHER.mask(title.lower())
+
 def load_json_file(file_path):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"{file_path} not found.")
@@ -63,35 +132,26 @@ def normalize_title(title, brand=None):
     # Lowercase and remove non-alphanumeric characters (except spaces)
     return re.sub(r'[^a-z0-9 ]', '', title.lower())
 
-def calculate_match_score(used_title, new_title, used_price, new_price, brand, threshold=80):
+def calculate_match_score(used_title, new_title, used_price, new_price, brand, threshold=80,
+                          used_title_norm=None, new_title_norm=None):
     """
     Calculate match score considering model/series match, fuzzy title match, and price difference.
     This version applies a dynamic penalty based on the price difference percentage.
+    Already-normalized titles can be passed in to skip normalizing them again.
     """
     # Normalize the titles by removing color terms, common terms, and brand names
-    used_title_norm = normalize_title(used_title, brand)
-    new_title_norm = normalize_title(new_title, brand)
+    if used_title_norm is None:
+        used_title_norm = normalize_title(used_title, brand)
+    if new_title_norm is None:
+        new_title_norm = normalize_title(new_title, brand)
     
     # Fuzzy title matching score using token_set_ratio
     fuzzy_score = fuzz.token_set_ratio(used_title_norm, new_title_norm)
 
-    # Core Model/Series Terms - the important parts of the title that should match more heavily
-    model_series_terms = [
-        "american professional", "american vintage", "vintera", "american standard", "american ultra", "american performer",
-        "player", "mim", "75th anniversary", "commemorative", "custom shop", "artist series", "les paul studio",
-        "les paul standard", "les paul tribute", "sg standard", "sg special", "flying v", "explorer", "custom shop",
-        "slash", "inspired by gibson", "se", "mark holcomb", "s2", "mccarty", "private stock", "hellraiser", 
-        "sun valley super shredder", "reaper", "blackjack", "c-1", "pro series", "sl2", "soloist", "rhoads", 
-        "dinky", "evh", "wolfgang", "rg", "s", "prestige", "jem"
-    ]
-
-    # Add a bonus for core model/series match
-    model_bonus = 0
-    for term in model_series_terms:
-        if term in used_title.lower() and term in new_title.lower():
-            model_bonus += 5
-        elif term in used_title.lower() or term in new_title.lower():
-            model_bonus -= 5
+    # Add a bonus for core model/series match: +5 per MODEL_SERIES term in both titles, -5 per term in only one
+    used_mask = series_mask(used_title)
+    new_mask = series_mask(new_title)
+    model_bonus = 5 * (used_mask & new_mask).bit_count() - 5 * (used_mask ^ new_mask).bit_count()
 
     # Calculate price difference percentage for scoring
     price_diff_percent = (new_price - used_price) / new_price * 100
@@ -132,6 +192,16 @@ def calculate_match_score(used_title, new_title, used_price, new_price, brand, t
 
     return final_score
 
+def max_score_bonus(used_title):
+    """
+    Most calculate_match_score can end up above the fuzzy score for this used title: the model bonus if every
+    MODEL_SERIES term in it is matched and nothing else differs, less the short-title penalty (the price score
+    only ever subtracts). A match needs a fuzzy score of at least cutoff - max_score_bonus to score above cutoff.
+    """
+    short = len(used_title.split()) <= 2
+    bonus = 5 * series_mask(used_title).bit_count() * (1.5 if short else 1)
+    return bonus - 10 if short else bonus
+
 def find_best_match(used_guitar, new_guitars_by_brand, threshold=80):
     """
     Find the best fuzzy title match among new guitars of the same brand.
@@ -168,6 +238,219 @@ def find_best_match(used_guitar, new_guitars_by_brand, threshold=80):
 
     return None, 0
 
+def blocking_keys(title_norm):
+    """Return the inverted-index keys for a normalized title: its words plus any MODEL_SERIES phrases it contains."""
+    keys = set(title_norm.split())
+    padded = f" {title_norm} "
+    for term in NORMALIZED_SERIES:
+        if " " in term and f" {term} " in padded:
+            keys.add(term)
+    return keys
+
+class GuitarMatcher:
+    """
+    Prepared matcher over the new guitar catalog, meant to be built once and reused for every used guitar.
+    New titles are normalized once per brand and used title normalizations are cached,
+    so a run no longer renormalizes the whole brand bucket for each used listing.
+    Colour variants of a model normalize to the same title, so each distinct title is fuzzy-scored once
+    and the best match is then picked among its variants by their own match scores (prices differ).
+    """
+
+    def __init__(self, new_guitars_by_brand, max_key_share=0.8):
+        self.new_guitars_by_brand = new_guitars_by_brand
+        with METRICS.stage("normalize"):
+            self.normalized_by_brand = {
+                brand: [normalize_title(g['title'], brand) for g in guitars]
+                for brand, guitars in new_guitars_by_brand.items()
+            }
+        self._norm_cache = {}
+
+        # Distinct normalized titles per brand (in first-seen order) and the bucket indices of each one's variants
+        self.titles_by_brand = {}
+        self.variants_by_brand = {}
+        for brand, titles in self.normalized_by_brand.items():
+            groups = {}
+            for idx, title_norm in enumerate(titles):
+                groups.setdefault(title_norm, []).append(idx)
+            self.titles_by_brand[brand] = list(groups)
+            self.variants_by_brand[brand] = list(groups.values())
+
+        # Inverted index per brand: blocking key -> positions of the distinct titles that have that key.
+        # Keys shared by more than max_key_share of a bucket (e.g. "electric") are too broad to block on.
+        self.max_key_share = max_key_share
+        self.token_index_by_brand = {}
+        with METRICS.stage("index"):
+            for brand, titles in self.titles_by_brand.items():
+                index = {}
+                for idx, title_norm in enumerate(titles):
+                    for key in blocking_keys(title_norm):
+                        index.setdefault(key, []).append(idx)
+                self.token_index_by_brand[brand] = index
+
+    def normalize(self, title, brand):
+        """Return normalize_title(title, brand), computing it only once per (title, brand)."""
+        key = (title, brand)
+        norm = self._norm_cache.get(key)
+        if norm is None:
+            METRICS.count("normalize_cache_misses")
+            with METRICS.stage("normalize"):
+                norm = normalize_title(title, brand)
+            self._norm_cache[key] = norm
+        else:
+            METRICS.count("normalize_cache_hits")
+        return norm
+
+    def candidates(self, used_title_norm, brand):
+        """
+        Return the sorted positions of the brand's distinct titles that share a blocking key with the used title.
+        Only keys rarer than max_key_share of them are used; if all keys are that common, the rarest one is.
+        """
+        index = self.token_index_by_brand.get(brand, {})
+        postings = sorted((index[key] for key in blocking_keys(used_title_norm) if key in index), key=len)
+        if not postings:
+            return []
+
+        limit = self.max_key_share * len(self.titles_by_brand[brand])
+        selective = [p for p in postings if len(p) <= limit] or postings[:1]
+        found = set()
+        for posting in selective:
+            found.update(posting)
+        return sorted(found)
+
+    def find_best_match(self, used_guitar, threshold=80, blocking=False, score_cutoff=None):
+        """
+        find_best_match(used_guitar, new_guitars_by_brand, threshold) using the prepared index; where the best
+        title has colour variants, the first of them is returned, as extractOne over every listing would.
+        With blocking=True only the candidates from the inverted index are fuzzy-scored.
+        A score_cutoff above threshold lets rapidfuzz give up early on titles that can't reach it; the result is
+        then (None, 0) unless the best title scores at least that much.
+        """
+        cutoff = threshold if score_cutoff is None else max(threshold, score_cutoff)
+        brand = used_guitar.get('brand')
+        if not brand or brand not in self.new_guitars_by_brand:
+            METRICS.count("hits_skipped")
+            return None, 0
+
+        used_title_norm = self.normalize(used_guitar.get('title', ''), brand)
+        normalized_choices = self.titles_by_brand[brand]
+
+        if blocking:
+            candidate_idx = self.candidates(used_title_norm, brand)
+            METRICS.count("candidates_scored", len(candidate_idx))
+            with METRICS.stage("fuzzy_score"):
+                best_match = process.extractOne(used_title_norm, [normalized_choices[i] for i in candidate_idx],
+                                                scorer=fuzz.token_set_ratio, score_cutoff=cutoff)
+            if best_match:
+                best_match = (best_match[0], best_match[1], candidate_idx[best_match[2]])
+        else:
+            METRICS.count("candidates_scored", len(normalized_choices))
+            with METRICS.stage("fuzzy_score"):
+                best_match = process.extractOne(used_title_norm, normalized_choices, scorer=fuzz.token_set_ratio,
+                                                score_cutoff=cutoff)
+
+        if best_match and best_match[1] >= threshold:
+            METRICS.count("matches_above_threshold")
+            return self._score_title(used_guitar, brand, best_match[2])
+
+        return None, 0
+
+    def _score_title(self, used_guitar, brand, title_idx):
+        """(matched guitar, score) for one distinct title: its first colour variant, even if another scores higher."""
+        matched_guitar = self.new_guitars_by_brand[brand][self.variants_by_brand[brand][title_idx][0]]
+        used_title_norm = self.normalize(used_guitar.get('title'), brand)
+        with METRICS.stage("match_score"):
+            score = calculate_match_score(
+                used_title=used_guitar.get('title'),
+                new_title=matched_guitar.get('title'),
+                used_price=used_guitar.get('price') or 0,
+                new_price=matched_guitar.get('price') or 0,
+                brand=brand,
+                used_title_norm=used_title_norm,
+                new_title_norm=self.titles_by_brand[brand][title_idx]
+            )
+        return matched_guitar, score
+
+    def match_all(self, used_guitars, threshold=80, workers=-1, block_size=1024, blocking=False):
+        """
+        Batch version of find_best_match: returns one (matched_guitar, score) pair per used guitar, in order.
+        Each brand bucket is scored as a used x new token_set_ratio matrix with rapidfuzz's cdist,
+        spread over `workers` cores (-1 = all) in blocks of `block_size` rows to bound memory.
+        With blocking=True each used guitar is only scored against its inverted-index candidates instead.
+        """
+        if blocking:
+            return [self.find_best_match(used, threshold, blocking=True) for used in used_guitars]
+
+        results = [(None, 0)] * len(used_guitars)
+
+        rows_by_brand = {}
+        for i, used in enumerate(used_guitars):
+            brand = used.get('brand')
+            if brand and brand in self.new_guitars_by_brand:
+                rows_by_brand.setdefault(brand, []).append(i)
+            else:
+                METRICS.count("hits_skipped")
+
+        for brand, rows in rows_by_brand.items():
+            normalized_choices = self.titles_by_brand[brand]
+            for start in range(0, len(rows), block_size):
+                block = rows[start:start + block_size]
+                queries = [self.normalize(used_guitars[i].get('title', ''), brand) for i in block]
+
+                # float64 keeps threshold comparisons identical to extractOne's scores
+                METRICS.count("candidates_scored", len(block) * len(normalized_choices))
+                with METRICS.stage("fuzzy_score"):
+                    scores = process.cdist(queries, normalized_choices, scorer=fuzz.token_set_ratio,
+                                           dtype=np.float64, workers=workers)
+                    best_idx = scores.argmax(axis=1)
+                    best_scores = scores[np.arange(len(block)), best_idx]
+
+                above = np.flatnonzero(best_scores >= threshold)
+                METRICS.count("matches_above_threshold", len(above))
+                for j in above:
+                    i = block[j]
+                    results[i] = self._score_title(used_guitars[i], brand, int(best_idx[j]))
+
+        return results
+
+def blocking_recall(matcher, used_guitars, threshold=80):
+    """
+    Compare candidate blocking against the exhaustive path.
+    Returns how many exhaustive matches blocking kept, changed or dropped, and the average candidate count.
+    """
+    exhaustive = matcher.match_all(used_guitars, threshold)
+    blocked = matcher.match_all(used_guitars, threshold, blocking=True)
+
+    kept = changed = dropped = 0
+    for (full_match, _), (block_match, _) in zip(exhaustive, blocked):
+        if full_match is None:
+            continue
+        if block_match is full_match:
+            kept += 1
+        elif block_match is None:
+            dropped += 1
+        else:
+            changed += 1
+
+    candidate_counts = []
+    bucket_sizes = []
+    for used in used_guitars:
+        brand = used.get('brand')
+        if brand and brand in matcher.new_guitars_by_brand:
+            title_norm = matcher.normalize(used.get('title', ''), brand)
+            candidate_counts.append(len(matcher.candidates(title_norm, brand)))
+            bucket_sizes.append(len(matcher.new_guitars_by_brand[brand]))
+
+    total = kept + changed + dropped
+    return {
+        'exhaustive_matches': total,
+        'kept': kept,
+        'changed': changed,
+        'dropped': dropped,
+        'recall': kept / total if total else 1.0,
+        'avg_candidates': sum(candidate_counts) / len(candidate_counts) if candidate_counts else 0,
+        'avg_bucket_size': sum(bucket_sizes) / len(bucket_sizes) if bucket_sizes else 0
+    }
+
 def generate_used_url(used, base_url="https://www.sweetwater.com"):
     """Generate the correct used guitar URL based on the store and guitar title."""
     store = used.get('store', 'Guitar Center')
@@ -184,77 +467,234 @@ def generate_used_url(used, base_url="https://www.sweetwater.com"):
     
     return used_url
 
+BASE_URLS = {
+    "Guitar Center": "https://www.guitarcenter.com",
+    "Sweetwater": "https://www.sweetwater.com/used/listings"
+}
+
+def bucket_by_brand(new_guitars):
+    """Index new guitars by brand for faster lookup."""
+    new_guitars_by_brand = {}
+    for g in new_guitars:
+        brand = g.get('brand')
+        if brand:
+            new_guitars_by_brand.setdefault(brand, []).append(g)
+    return new_guitars_by_brand
+
+def build_match(used, new_match, score):
+    """Build the report row for a used guitar and its matched new guitar, or None if the used one isn't cheaper."""
+    used_price = used.get('price') or 0
+    new_price = new_match.get('price') or 0
+    
+    used_shipping = used.get('shipping_price', 0)
+    if used.get('store') == "Sweetwater":
+        if used_shipping == 0:
+            used_shipping = 0
+        else:
+            used_shipping = used_shipping
+    else:
+        used_shipping = used_shipping or 30  # Default to $30 shipping fee if not set
+
+    # Summed in integer cents so e.g. 1299.99 - (899.99 + 30) is exactly 370.0
+    discount = (to_cents(new_price) - to_cents(used_price) - to_cents(used_shipping)) / 100
+    
+    if discount <= 0:
+        return None
+
+    store = used.get('store', 'Guitar Center')
+    base_url = BASE_URLS.get(store, BASE_URLS["Guitar Center"])
+    used_url = generate_used_url(used, base_url)
+    
+    return {
+        'used_title': used.get('title'),
+        'used_price': used_price,
+        'used_condition': used.get('condition'),
+        'used_store': used.get('store'),
+        'new_title': new_match.get('title'),
+        'new_price': new_price,
+        'new_store': new_match.get('store'),
+        'price_difference': discount,
+        'match_score': score,
+        'new_url': new_match.get('url'),
+        'used_url': used_url,
+        'used_shipping': used_shipping
+    }
+
+def iter_matches(matched):
+    """Yield report rows from (used guitar, (new match, score)) pairs where the new guitar costs more."""
+    for used, (new_match, score) in matched:
+        if new_match:
+            match = build_match(used, new_match, score)
+            if match:
+                yield match
+
+def stream_top_matches(matcher, used_guitars, used_price=(500, 900), new_price=(800, 1500), min_score=70, k=100,
+                       threshold=80, blocking=False, out_file=None):
+    """
+    select_top_matches(iter_matches(...)) without ever holding the match list: used guitars are matched one at
+    a time and only the best k report rows are kept, in a bounded heap.
+    Work that can't change the report is skipped: used guitars outside the used price window aren't matched,
+    and fuzzy scoring is cut off below what a title would need to beat min_score (or, once k rows are held,
+    the lowest of them) given max_score_bonus.
+    With out_file, every row that passes the report's filters is also written to it as NDJSON when found;
+    all of them are then scored, not just those that could still make the top k.
+    """
+    top = TopK(k)
+    for used in used_guitars:
+        if not in_window(price_of(used), used_price):
+            METRICS.count("pruned_by_price")
+            continue
+
+        cutoff = min_score
+        floor = top.floor()
+        if out_file is None and floor is not None:
+            cutoff = max(cutoff, floor)
+        # Slightly below the bound so float rounding in calculate_match_score can't prune a row that gets in
+        needed = cutoff - max_score_bonus(used.get('title') or '') - 1e-9
+        if needed > 100:
+            METRICS.count("pruned_by_cutoff")
+            continue
+        matched, score = matcher.find_best_match(used, threshold, blocking, score_cutoff=needed)
+        if matched is None:
+            continue
+
+        match = build_match(used, matched, score)
+        if match is None or not in_window(match['new_price'], new_price) or match['match_score'] <= min_score:
+            continue
+        if out_file is not None:
+            out_file.write(json.dumps(match, ensure_ascii=False) + "\n")
+        top.push(match['match_score'], match)
+    return top.results()
+
+def add_report_arguments(parser):
+    """Command-line options for the match report's price windows, score cut-off and length."""
+    parser.add_argument("--used-price", type=float, nargs=2, default=(500, 900), metavar=("LOW", "HIGH"),
+                        help="Only report used guitars priced strictly between LOW and HIGH")
+    parser.add_argument("--new-price", type=float, nargs=2, default=(800, 1500), metavar=("LOW", "HIGH"),
+                        help="Only report new guitars priced strictly between LOW and HIGH")
+    parser.add_argument("--min-score", type=float, default=70,
+                        help="Only report matches scoring above this")
+    parser.add_argument("--top", type=int, default=100,
+                        help="Number of matches to report")
+
+def report_options(args):
+    return {
+        'used_price': args.used_price,
+        'new_price': args.new_price,
+        'min_score': args.min_score,
+        'k': args.top
+    }
+
+def print_matches(top_matches):
+    for idx, match in enumerate(top_matches, 1):
+        print(f"{idx}. Used: {match['used_title']} (${match['used_price']} + ${match['used_shipping']} shipping) [{match['used_condition']}, {match['used_store']}]")
+        print(f"    New:  {match['new_title']} (${match['new_price']}) [{match['new_store']}]")
+        print(f"    Price difference (new - used): ${match['price_difference']:.2f} (Match score: {match['match_score']})")
+        print(f"    New URL: {match['new_url']}")
+        print(f"    Used URL/Slug: {match['used_url']}")
+        print()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match used guitars against the new guitar catalog.")
+    parser.add_argument("--workers", type=int, default=-1,
+                        help="Cores used for batch matching (-1 = all cores)")
+    parser.add_argument("--blocking", action="store_true",
+                        help="Only fuzzy-score new guitars that share a title token or model series with the used guitar")
+    parser.add_argument("--recall-check", action="store_true",
+                        help="Report how many exhaustive matches candidate blocking drops, then exit")
+    parser.add_argument("--any-brand", action="store_true",
+                        help="Match across brands: shortlist the nearest new titles by character n-gram TF-IDF "
+                             "similarity instead of requiring the exact same brand (needs scipy)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse stored matches and only rematch used listings that are new or changed, "
+                             "or whose brand's new-catalog bucket changed")
+    parser.add_argument("--stream", action="store_true",
+                        help="Match one used guitar at a time keeping only the top rows, skipping guitars and "
+                             "titles that can't make the report")
+    parser.add_argument("--ndjson", metavar="PATH",
+                        help="With --stream, also write every row that passes the report filters to PATH as NDJSON "
+                             "as it is found (implies --stream)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Read the binary catalogs written by the parsing scripts with --columnar; only used "
+                             "guitars inside the used price window are decoded")
+    parser.add_argument("--sqlite", nargs="?", const=catalog_db.DEFAULT_PATH, metavar="PATH",
+                        help="Query the match rows stored by pipeline.py --sqlite instead of loading and matching")
+    add_report_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.any_brand and (args.blocking or args.incremental or args.recall_check):
+        parser.error("--any-brand can't be combined with --blocking, --incremental or --recall-check")
+    args.stream = args.stream or bool(args.ndjson)
+    if args.stream and (args.any_brand or args.incremental or args.recall_check):
+        parser.error("--stream can't be combined with --any-brand, --incremental or --recall-check")
+    start_metrics(args)
+
     try:
-        used_guitars = load_json_file('./data/combined/used_guitars_combined.json')
-        new_guitars = load_json_file('./data/combined/new_guitars_combined.json')
-
-        # Index new guitars by brand for faster lookup
-        new_guitars_by_brand = {}
-        for g in new_guitars:
-            brand = g.get('brand')
-            if brand:
-                new_guitars_by_brand.setdefault(brand, []).append(g)
-
-        BASE_URLS = {
-            "Guitar Center": "https://www.guitarcenter.com",
-            "Sweetwater": "https://www.sweetwater.com/used/listings"
-        }
-
-        matches = []
-        for used in used_guitars:
-            new_match, score = find_best_match(used, new_guitars_by_brand)
-            if new_match:
-                used_price = used.get('price') or 0
-                new_price = new_match.get('price') or 0
-                
-                used_shipping = used.get('shipping_price', 0)
-                if used.get('store') == "Sweetwater":
-                    if used_shipping == 0:
-                        used_shipping = 0
-                    else:
-                        used_shipping = used_shipping
-                else:
-                    used_shipping = used_shipping or 30  # Default to $30 shipping fee if not set
-
-                used_total_price = used_price + used_shipping
-                discount = new_price - used_total_price
-                
-                if discount > 0:
-                    store = used.get('store', 'Guitar Center')
-                    base_url = BASE_URLS.get(store, BASE_URLS["Guitar Center"])
-                    used_url = generate_used_url(used, base_url)
-                    
-                    matches.append({
-                        'used_title': used.get('title'),
-                        'used_price': used_price,
-                        'used_condition': used.get('condition'),
-                        'used_store': used.get('store'),
-                        'new_title': new_match.get('title'),
-                        'new_price': new_price,
-                        'new_store': new_match.get('store'),
-                        'price_difference': discount,
-                        'match_score': score,
-                        'new_url': new_match.get('url'),
-                        'used_url': used_url,
-                        'used_shipping': used_shipping
-                    })
-
-        # Continue sorting and filtering...
-        top_matches = sorted(matches, key=lambda x: x['match_score'], reverse=True)
-        top_matches = [match for match in top_matches if 500 < match['used_price'] < 900]
-        top_matches = [match for match in top_matches if 800 < match['new_price'] < 1500]
-        top_matches = [match for match in top_matches if match['match_score'] > 70]
-        top_matches = top_matches[:100]
+        if args.sqlite:
+            with METRICS.stage("sort_filter"), catalog_db.open_existing(args.sqlite) as conn:
+                print_matches(catalog_db.query_top_matches(conn, **report_options(args)))
+            finish_metrics(args)
+            raise SystemExit(0)
+
+        with METRICS.stage("load"):
+            if args.columnar:
+                with columnar.ColumnarCatalog('./data/combined/used_guitars_combined.cols') as used_catalog, \
+                        columnar.ColumnarCatalog('./data/combined/new_guitars_combined.cols') as new_catalog:
+                    new_guitars = new_catalog.records()
+                    # Deduplicated like the JSON catalogs below; used guitars outside the used price window can't be reported
+                    rows = used_catalog.unique_rows()
+                    if not args.recall_check:
+                        rows = rows[columnar.window_mask(used_catalog.prices()[rows], args.used_price)]
+                    used_guitars = used_catalog.records(rows)
+            else:
+                used_guitars = load_listings('./data/combined/used_guitars_combined.json')
+                new_guitars = load_listings('./data/combined/new_guitars_combined.json')
+
+        used_guitars, new_guitars = dedup_catalogs(used_guitars, new_guitars)
+
+        with METRICS.stage("bucket"):
+            new_guitars_by_brand = bucket_by_brand(new_guitars)
+
+        if args.any_brand:
+            # Imported here: it needs scipy, which the brand-bucketed matcher doesn't
+            from ngram_matcher import NgramMatcher
+            best_matches = NgramMatcher(new_guitars).match_all(used_guitars)
+            matches = iter_matches(zip(used_guitars, best_matches))
+            with METRICS.stage("sort_filter"):
+                print_matches(select_top_matches(matches, **report_options(args)))
+            finish_metrics(args)
+            raise SystemExit(0)
+
+        matcher = GuitarMatcher(new_guitars_by_brand)
+
+        if args.recall_check:
+            print(json.dumps(blocking_recall(matcher, used_guitars), indent=2))
+            raise SystemExit(0)
+
+        if args.stream:
+            with open(args.ndjson, 'w', encoding='utf-8') if args.ndjson else nullcontext() as out_file:
+                with METRICS.stage("stream_match"):
+                    top_matches = stream_top_matches(matcher, used_guitars, blocking=args.blocking,
+                                                     out_file=out_file, **report_options(args))
+            print_matches(top_matches)
+            finish_metrics(args)
+            raise SystemExit(0)
+
+        if args.incremental:
+            match_cache = MatchCache('./data/.match_cache/matches.json', code_path=__file__,
+                                     options={'blocking': args.blocking, 'max_key_share': matcher.max_key_share})
+            best_matches = match_cache.match_all(matcher, used_guitars, workers=args.workers, blocking=args.blocking)
+            match_cache.save()
+        else:
+            best_matches = matcher.match_all(used_guitars, workers=args.workers, blocking=args.blocking)
+
+        matches = iter_matches(zip(used_guitars, best_matches))
+        with METRICS.stage("sort_filter"):
+            top_matches = select_top_matches(matches, **report_options(args))
 
         # Output results
-        for idx, match in enumerate(top_matches, 1):
-            print(f"{idx}. Used: {match['used_title']} (${match['used_price']} + ${match['used_shipping']} shipping) [{match['used_condition']}, {match['used_store']}]")
-            print(f"    New:  {match['new_title']} (${match['new_price']}) [{match['new_store']}]")
-            print(f"    Price difference (new - used): ${match['price_difference']:.2f} (Match score: {match['match_score']})")
-            print(f"    New URL: {match['new_url']}")
-            print(f"    Used URL/Slug: {match['used_url']}")
-            print()
+        print_matches(top_matches)
+        finish_metrics(args)
 
     except Exception as e:
         print(f"Error: {e}")
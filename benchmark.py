@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from analysis import GuitarMatcher, bucket_by_brand, iter_matches, normalize_title
+from deal_queries import select_top_matches
+from dedup import dedup_catalogs
+from dump_streaming import write_json_array
+from listing import load_listings
+from new_guitar_parsing import iter_new_guitars, load_json_file, new_guitar_files, parse_new_guitars
+from synthetic_catalog import generate_catalog
+from used_guitar_parsing import iter_used_guitars, used_guitar_jobs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmarks whose cost grows with used x new; they are skipped above --max-match-size
+QUADRATIC = {"analysis"}
+
+
+def _combined(data_folder, kind):
+    return load_listings(os.path.join(data_folder, 'combined', f'{kind}_guitars_combined.json'))
+
+
+def bench_parse_used(data_folder, options):
+    """Every used dump through the parser its format needs, as the parsing script reads them."""
+    return sum(1 for _ in iter_used_guitars(used_guitar_jobs(data_folder)))
+
+
+def bench_parse_new(data_folder, options):
+    count = 0
+    for path in new_guitar_files(data_folder):
+        count += len(parse_new_guitars(load_json_file(path)))
+    return count
+
+
+def bench_normalize_title(data_folder, options):
+    guitars = _combined(data_folder, 'used') + _combined(data_folder, 'new')
+    start = time.perf_counter()
+    for guitar in guitars:
+        normalize_title(guitar['title'], guitar['brand'])
+    return len(guitars), time.perf_counter() - start
+
+
+def bench_find_best_match(data_folder, options):
+    """Per-listing GuitarMatcher.find_best_match on a sample of used guitars (the matcher's index is built untimed)."""
+    used_guitars = _combined(data_folder, 'used')[:options['match_sample']]
+    matcher = GuitarMatcher(bucket_by_brand(_combined(data_folder, 'new')))
+    start = time.perf_counter()
+    for used in used_guitars:
+        matcher.find_best_match(used)
+    return len(used_guitars), time.perf_counter() - start
+
+
+def bench_ngram_match(data_folder, options):
+    """Brand-agnostic n-gram matching of every used guitar against the whole new catalog (index build included)."""
+    from ngram_matcher import NgramMatcher
+
+    used_guitars = _combined(data_folder, 'used')
+    new_guitars = _combined(data_folder, 'new')
+    start = time.perf_counter()
+    NgramMatcher(new_guitars).match_all(used_guitars)
+    return len(used_guitars), time.perf_counter() - start
+
+
+def bench_analysis(data_folder, options):
+    """
+    The default `python analysis.py` report over the combined files: load, dedup, batch matching and the top-match
+    selection, called directly so that a failure fails the benchmark instead of printing an error.
+    """
+    used_guitars, new_guitars = dedup_catalogs(_combined(data_folder, 'used'), _combined(data_folder, 'new'))
+    best_matches = GuitarMatcher(bucket_by_brand(new_guitars)).match_all(used_guitars)
+    select_top_matches(iter_matches(zip(used_guitars, best_matches)))
+    return len(used_guitars)
+
+
+BENCHMARKS = {
+    "parse_used": bench_parse_used,
+    "parse_new": bench_parse_new,
+    "normalize_title": bench_normalize_title,
+    "find_best_match": bench_find_best_match,
+    "ngram_match": bench_ngram_match,
+    "analysis": bench_analysis,
+}
+
+
+def peak_rss():
+    """
+    This process's peak RSS in bytes. On Linux that is VmHWM, which starts over at exec; the child's ru_maxrss
+    seen by a parent would start from the parent's own high-water mark inherited through fork.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def run_child(name, data_folder, options):
+    """Run one benchmark in this (fresh) process and print its item count, time and peak RSS as JSON."""
+    start = time.perf_counter()
+    result = BENCHMARKS[name](data_folder, options)
+    items, seconds = result if isinstance(result, tuple) else (result, time.perf_counter() - start)
+    print(json.dumps({"items": items, "seconds": seconds, "peak_rss": peak_rss()}))
+
+
+def measure(name, data_folder, options):
+    """Run a benchmark in a child process so its peak RSS is its own; returns items, seconds, throughput and RSS."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name, data_folder,
+           "--match-sample", str(options['match_sample'])]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, cwd=ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark {name} failed on {data_folder}")
+    result = json.loads(proc.stdout.decode().strip().splitlines()[-1])
+    result["throughput"] = result["items"] / result["seconds"] if result["seconds"] else None
+    result["peak_rss_mb"] = round(result.pop("peak_rss") / (1024 * 1024), 1)
+    return result
+
+
+def prepare(work_dir, size, seed):
+    """Generate `size` used and `size` new hits plus their combined files; returns the data folder."""
+    data_folder = os.path.join(work_dir, str(size), 'data')
+    if os.path.exists(os.path.join(data_folder, 'combined', 'new_guitars_combined.json')):
+        return data_folder
+    generate_catalog(data_folder, size, size, seed)
+    combined = os.path.join(data_folder, 'combined')
+    os.makedirs(combined, exist_ok=True)
+    with open(os.path.join(combined, 'used_guitars_combined.json'), 'w', encoding='utf-8') as f:
+        write_json_array(iter_used_guitars(used_guitar_jobs(data_folder)), f)
+    with open(os.path.join(combined, 'new_guitars_combined.json'), 'w', encoding='utf-8') as f:
+        write_json_array(iter_new_guitars(new_guitar_files(data_folder)), f)
+    return data_folder
+
+
+def scaling_exponents(rows):
+    """Log-log slope of time against catalog size between consecutive sizes (1 = linear, 2 = quadratic)."""
+    exponents = []
+    for (n1, r1), (n2, r2) in zip(rows, rows[1:]):
+        if r1["seconds"] > 0 and r2["seconds"] > 0:
+            exponents.append(round(math.log(r2["seconds"] / r1["seconds"]) / math.log(n2 / n1), 2))
+        else:
+            exponents.append(None)
+    return exponents
+
+
+def run_suite(sizes, benchmarks, work_dir, options, seed=0):
+    report = {"sizes": sizes, "options": options, "benchmarks": {}}
+    for name in benchmarks:
+        rows = []
+        for size in sizes:
+            if name in QUADRATIC and size > options['max_match_size']:
+                print(f"{name:>16} {size:>9}  skipped (above --max-match-size)")
+                continue
+            data_folder = prepare(work_dir, size, seed)
+            result = measure(name, data_folder, options)
+            rows.append((size, result))
+            print(f"{name:>16} {size:>9}  {result['seconds']:9.3f}s  {result['throughput'] or 0:12.0f} items/s"
+                  f"  {result['peak_rss_mb']:8.1f} MB peak RSS")
+        report["benchmarks"][name] = {
+            "runs": [dict(size=size, **result) for size, result in rows],
+            "scaling_exponents": scaling_exponents(rows)
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the parsers and matcher on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Catalog sizes (hits per used and new catalog); up to 1000000")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--work-dir", help="Where generated catalogs are kept (reused between runs); default is a temp dir")
+    parser.add_argument("--match-sample", type=int, default=50,
+                        help="Used guitars timed with GuitarMatcher.find_best_match")
+    parser.add_argument("--max-match-size", type=int, default=20000,
+                        help="Largest size for the used x new full analysis run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--child", nargs=2, metavar=("BENCHMARK", "DATA_FOLDER"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    options = {"match_sample": args.match_sample, "max_match_size": args.max_match_size}
+    if args.child:
+        run_child(args.child[0], args.child[1], options)
+        raise SystemExit(0)
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="guitar-bench-"))
+        report = run_suite(sorted(args.sizes), args.benchmarks, work_dir, options, args.seed)
+
+    for name, result in report["benchmarks"].items():
+        print(f"{name:>16} scaling exponents: {result['scaling_exponents']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
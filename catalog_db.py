@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from itertools import islice
+
+from deal_queries import price_of
+from listing import Listing, json_default
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'catalog.sqlite')
+
+# Listings keep their filterable fields as indexed columns and the full parsed record as JSON, so query results
+# are the same dicts the JSON files hold. position is the record's index in its combined file / match list,
+# which keeps tie-breaks identical to the list-based filters.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    position INTEGER PRIMARY KEY,
+    brand TEXT,
+    price REAL NOT NULL,
+    condition TEXT,
+    store TEXT,
+    discount REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {table}_brand ON {table} (brand, price);
+CREATE INDEX IF NOT EXISTS {table}_price ON {table} (price);
+CREATE INDEX IF NOT EXISTS {table}_condition ON {table} (condition, price);
+CREATE INDEX IF NOT EXISTS {table}_store ON {table} (store, price);
+CREATE INDEX IF NOT EXISTS {table}_discount ON {table} (discount DESC, position);
+
+CREATE TABLE IF NOT EXISTS matches (
+    position INTEGER PRIMARY KEY,
+    used_price REAL NOT NULL,
+    new_price REAL NOT NULL,
+    match_score REAL NOT NULL,
+    used_condition TEXT,
+    used_store TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_score ON matches (match_score DESC, position);
+CREATE INDEX IF NOT EXISTS matches_used_price ON matches (used_price);
+"""
+
+TABLES = {"used": "used_guitars", "new": "new_guitars"}
+
+BATCH_SIZE = 1000
+
+
+def real_discount(guitar):
+    """original_price - price when the guitar is actually discounted, else 0 (calculate_discount in the analysis scripts)."""
+    original = price_of(guitar, "original_price")
+    current = price_of(guitar, "price")
+    return original - current if original > 0 and current > 0 and current < original else 0
+
+
+def connect(db_path=DEFAULT_PATH):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    for table in TABLES.values():
+        conn.executescript(SCHEMA.format(table=table))
+    return conn
+
+
+@contextmanager
+def transaction(db_path=DEFAULT_PATH):
+    """Connection that commits when the block completes (rolling back if it raises) and is then closed."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def open_existing(db_path=DEFAULT_PATH):
+    """Connect to a catalog that must already have been written by the parsers or the pipeline."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"{db_path} not found; run the parsers or pipeline.py with --sqlite first.")
+    return connect(db_path)
+
+
+def _listing_row(position, guitar):
+    return (position, guitar.get('brand'), price_of(guitar), guitar.get('condition'), guitar.get('store'),
+            real_discount(guitar), json.dumps(guitar, ensure_ascii=False, default=json_default))
+
+
+def _match_row(position, match):
+    return (position, price_of(match, 'used_price'), price_of(match, 'new_price'), match['match_score'],
+            match.get('used_condition'), match.get('used_store'), json.dumps(match, ensure_ascii=False))
+
+
+def _tee(records, conn, table, make_row):
+    """
+    Pass records through while replacing the table's contents with them, in batched inserts.
+    Nothing is committed here: the caller commits once every tee on the connection has finished.
+    """
+    conn.execute(f"DELETE FROM {table}")
+    records = iter(records)
+    position = 0
+    while True:
+        batch = list(islice(records, BATCH_SIZE))
+        if not batch:
+            break
+        rows = [make_row(position + i, record) for i, record in enumerate(batch)]
+        conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+        position += len(batch)
+        yield from batch
+
+
+def tee_listings(guitars, conn, kind):
+    """
+    Write parsed 'used' or 'new' guitars into the catalog as they pass through.
+    The stored match rows were derived from the listings being replaced, so they are cleared in the same
+    transaction (right away, before a tee_matches on the connection writes the new ones).
+    """
+    conn.execute("DELETE FROM matches")
+    return _tee(guitars, conn, TABLES[kind], _listing_row)
+
+
+def tee_matches(matches, conn):
+    """Write match report rows (before any price or score filter) into the catalog as they pass through."""
+    return _tee(matches, conn, "matches", _match_row)
+
+
+def _window(column, low, high, clauses, params):
+    if low is not None:
+        clauses.append(f"{column} > ?")
+        params.append(low)
+    if high is not None:
+        clauses.append(f"{column} < ?")
+        params.append(high)
+
+
+def _records(conn, sql, params):
+    return [json.loads(record, object_hook=Listing.from_dict) for (record,) in conn.execute(sql, params)]
+
+
+def query_top_matches(conn, used_price=(500, 900), new_price=(800, 1500), min_score=70, k=100):
+    """select_top_matches as one indexed query over the stored match rows."""
+    clauses, params = ["match_score > ?"], [min_score]
+    _window("used_price", *(used_price or (None, None)), clauses, params)
+    _window("new_price", *(new_price or (None, None)), clauses, params)
+    sql = (f"SELECT record FROM matches WHERE {' AND '.join(clauses)} "
+           f"ORDER BY match_score DESC, position LIMIT ?")
+    return _records(conn, sql, params + [k])
+
+
+def query_top_discounts(conn, kind, k=10, min_price=None, max_price=None, brand=None, condition=None, store=None):
+    """top_discounts with calculate_discount as one indexed query; each returned guitar gets its "real_discount"."""
+    clauses, params = ["discount > 0"], []
+    _window("price", min_price, max_price, clauses, params)
+    for column, value in (("brand", brand), ("condition", condition), ("store", store)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    sql = (f"SELECT discount, record FROM {TABLES[kind]} WHERE {' AND '.join(clauses)} "
+           f"ORDER BY discount DESC, position LIMIT ?")
+    guitars = []
+    for discount, record in conn.execute(sql, params + [k]):
+        guitar = Listing.from_dict(json.loads(record))
+        guitar["real_discount"] = discount
+        guitars.append(guitar)
+    return guitars
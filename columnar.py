@@ -0,0 +1,312 @@
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from dedup import id_key
+from deal_queries import price_of
+from listing import FIELDS, PRICE_FIELDS, Listing
+
+MAGIC = b"GCOLCAT1"
+ALIGN = 8
+
+# Column layout by field; every field of a parsed listing is stored, so records round-trip exactly
+DICTIONARY_FIELDS = ("brand", "condition", "location", "store")
+STRING_FIELDS = ("title", "slug", "url")
+BOOL_FIELDS = ("shipping_available", "local_pickup_available")
+_BITS = {field: 1 << i for i, field in enumerate(FIELDS)}
+
+
+def columnar_path(json_path):
+    """The binary catalog written next to a combined JSON file."""
+    return os.path.splitext(json_path)[0] + ".cols"
+
+
+def window_mask(values, window):
+    """Vectorized in_window: low < values < high, a None bound leaving that side open."""
+    low, high = window or (None, None)
+    mask = np.ones(len(values), dtype=bool)
+    if low is not None:
+        mask &= low < values
+    if high is not None:
+        mask &= values < high
+    return mask
+
+
+class ColumnarWriter:
+    """
+    Accumulates parsed listings column by column (compact arrays, not records) and writes them as one binary catalog.
+
+    Layout: MAGIC, the header length (u64), a JSON header, then each column as a little-endian array aligned to
+    8 bytes at the offset the header gives:
+      price, original_price, price_drop, shipping_price   int64 cents (missing or None as 0)
+      brand, condition, location, store                   uint32 codes into the header's dictionaries
+      shipping_available, local_pickup_available          uint8
+      title, slug, url                                    uint64 offsets (rows + 1) into a UTF-8 heap
+      nulls, absent, floats                               uint16 bitmasks by FIELDS position: value is None, key is
+                                                          missing, price was a float (so 699.0 stays 699.0)
+    Values that don't fit their column (a numeric title, a sub-cent price) go to the header's overflow map.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.prices = {field: array('q') for field in PRICE_FIELDS}
+        self.codes = {field: array('I') for field in DICTIONARY_FIELDS}
+        self.dictionaries = {field: {} for field in DICTIONARY_FIELDS}
+        self.bools = {field: array('B') for field in BOOL_FIELDS}
+        self.offsets = {field: array('Q', [0]) for field in STRING_FIELDS}
+        self.heaps = {field: bytearray() for field in STRING_FIELDS}
+        self.flags = {name: array('H') for name in ("nulls", "absent", "floats")}
+        self.overflow = {}
+
+    def append(self, record):
+        keys = tuple(record)
+        if keys != FIELDS and keys != FIELDS[:-1]:
+            raise ValueError(f"Not a parsed listing: {', '.join(keys)}")
+        nulls = absent = floats = 0
+        extra = {}
+        for field in FIELDS:
+            bit = _BITS[field]
+            if field not in record:
+                absent |= bit
+                value = None
+            else:
+                value = record[field]
+                if value is None:
+                    nulls |= bit
+
+            if field in PRICE_FIELDS:
+                if type(value) is int and -2 ** 63 <= value * 100 < 2 ** 63:
+                    cents = value * 100
+                elif type(value) is float and math.isfinite(value) and round(value * 100) / 100 == value:
+                    cents = round(value * 100)
+                    floats |= bit
+                else:
+                    cents = round(price_of({field: value}, field) * 100)
+                    if value is not None:
+                        extra[field] = value
+                self.prices[field].append(cents)
+            elif field in DICTIONARY_FIELDS:
+                if value is not None and type(value) is not str:
+                    extra[field] = value
+                    value = None
+                codes = self.dictionaries[field]
+                self.codes[field].append(codes.setdefault(value, len(codes)))
+            elif field in BOOL_FIELDS:
+                if value is not None and type(value) is not bool:
+                    extra[field] = value
+                self.bools[field].append(1 if value is True else 0)
+            else:
+                if type(value) is str:
+                    self.heaps[field] += value.encode('utf-8')
+                elif value is not None:
+                    extra[field] = value
+                self.offsets[field].append(len(self.heaps[field]))
+
+        self.flags["nulls"].append(nulls)
+        self.flags["absent"].append(absent)
+        self.flags["floats"].append(floats)
+        if extra:
+            self.overflow[str(self.rows)] = extra
+        self.rows += 1
+
+    def _blobs(self):
+        for field, values in self.prices.items():
+            yield field, "<i8", values
+        for field, values in self.codes.items():
+            yield field, "<u4", values
+        for field, values in self.bools.items():
+            yield field, "u1", values
+        for field in STRING_FIELDS:
+            yield f"{field}.offsets", "<u8", self.offsets[field]
+            yield f"{field}.heap", "u1", self.heaps[field]
+        for name, values in self.flags.items():
+            yield name, "<u2", values
+
+    def write(self, path):
+        """Write the catalog atomically (to a temporary file, then renamed over path)."""
+        columns = {}
+        offset = 0
+        blobs = []
+        for name, dtype, values in self._blobs():
+            data = values.tobytes() if isinstance(values, array) else bytes(values)
+            columns[name] = {"dtype": dtype, "offset": offset, "length": len(data)}
+            blobs.append(data)
+            offset += len(data) + (-len(data) % ALIGN)
+        header = json.dumps({
+            "rows": self.rows,
+            "fields": FIELDS,
+            "columns": columns,
+            "dictionaries": {field: list(codes) for field, codes in self.dictionaries.items()},
+            "overflow": self.overflow
+        }, ensure_ascii=False).encode('utf-8')
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGN)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for data in blobs:
+                f.write(data + b"\0" * (-len(data) % ALIGN))
+        os.replace(tmp_path, path)
+
+
+def tee_columnar(records, path):
+    """Pass parsed listings through unchanged while collecting them into a binary catalog written at the end."""
+    writer = ColumnarWriter()
+    for record in records:
+        writer.append(record)
+        yield record
+    writer.write(path)
+
+
+class ColumnarCatalog:
+    """
+    Read-only, memory-mapped view of a binary catalog. Opening it only parses the header; columns are NumPy views
+    straight onto the mapping, so a scan touches just the pages of the columns it reads, and processes reading the
+    same file share those pages through the OS cache. Listings are built only for the rows asked for.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run the parsing scripts with --columnar first.")
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a binary catalog")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._mmap[start:start + header_length].decode('utf-8'))
+        self._data_start = start + header_length
+        self.rows = header["rows"]
+        self.columns = header["columns"]
+        self.dictionaries = header["dictionaries"]
+        self.overflow = {int(row): values for row, values in header["overflow"].items()}
+        self._views = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views handed out keep the mapping alive until they are garbage collected
+        self._views = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def column(self, name):
+        """A column as a read-only NumPy array over the mapping."""
+        view = self._views.get(name)
+        if view is None:
+            spec = self.columns[name]
+            dtype = np.dtype(spec["dtype"])
+            view = self._views[name] = np.frombuffer(self._mmap, dtype=dtype, count=spec["length"] // dtype.itemsize,
+                                                     offset=self._data_start + spec["offset"])
+        return view
+
+    def prices(self, field='price'):
+        """price_of(listing, field) for every row, as float64."""
+        values = self.column(field) / 100
+        for row, extra in self.overflow.items():
+            if field in extra:
+                values[row] = price_of(extra, field)
+        return values
+
+    def equals(self, field, value):
+        """Boolean mask of rows whose dictionary-encoded field equals value."""
+        codes = self.dictionaries[field]
+        if value not in codes:
+            return np.zeros(self.rows, dtype=bool)
+        mask = self.column(field) == codes.index(value)
+        for row, extra in self.overflow.items():
+            if field in extra:
+                mask[row] = extra[field] == value
+        return mask
+
+    def string(self, field, row):
+        extra = self.overflow.get(row)
+        if extra and field in extra:
+            return extra[field]
+        if int(self.column("nulls")[row]) & _BITS[field]:
+            return None
+        offsets = self.column(f"{field}.offsets")
+        start = self._data_start + self.columns[f"{field}.heap"]["offset"]
+        return self._mmap[start + int(offsets[row]):start + int(offsets[row + 1])].decode('utf-8')
+
+    def unique_rows(self):
+        """Rows that dedup_listings would keep: the first of each slug (or URL), plus rows with neither."""
+        seen = set()
+        rows = []
+        for row in range(self.rows):
+            listing = self.string("slug", row) or self.string("url", row)
+            if listing:
+                key = id_key(listing)
+                if key in seen:
+                    continue
+                seen.add(key)
+            rows.append(row)
+        return np.asarray(rows, dtype=np.int64)
+
+    def record(self, row):
+        """The parsed listing at row, equal to the record in the combined JSON file."""
+        row = int(row)
+        nulls = int(self.column("nulls")[row])
+        floats = int(self.column("floats")[row])
+        extra = self.overflow.get(row, {})
+        values = []
+        for field in FIELDS:
+            bit = _BITS[field]
+            if field in extra:
+                values.append(extra[field])
+            elif nulls & bit:
+                values.append(None)
+            elif field in PRICE_FIELDS:
+                cents = int(self.column(field)[row])
+                values.append(cents / 100 if floats & bit else cents // 100)
+            elif field in DICTIONARY_FIELDS:
+                values.append(self.dictionaries[field][self.column(field)[row]])
+            elif field in BOOL_FIELDS:
+                values.append(bool(self.column(field)[row]))
+            else:
+                values.append(self.string(field, row))
+        if int(self.column("absent")[row]) & _BITS["shipping_price"]:
+            values.pop()
+        return Listing(*values)
+
+    def records(self, rows=None):
+        return [self.record(row) for row in (range(self.rows) if rows is None else rows)]
+
+
+def top_discounts(catalog, k=10, min_price=None, max_price=None, brand=None, condition=None, store=None):
+    """
+    top_discounts with calculate_discount over the catalog's columns: only the price, original_price and filter
+    columns are scanned, and only the top k rows are turned into listings (each with its "real_discount").
+    """
+    price = catalog.prices('price')
+    original = catalog.prices('original_price')
+    discount = np.where((original > 0) & (price > 0) & (price < original), original - price, 0)
+    mask = (discount > 0) & window_mask(price, (min_price, max_price))
+    for field, value in (("brand", brand), ("condition", condition), ("store", store)):
+        if value is not None:
+            mask &= catalog.equals(field, value)
+    rows = np.flatnonzero(mask)
+    # Largest discount first, then file order, like the bounded heap over the JSON records
+    rows = rows[np.lexsort((rows, -discount[rows]))][:max(k, 0)]
+    guitars = []
+    for row in rows:
+        guitar = catalog.record(row)
+        guitar["real_discount"] = float(discount[row])
+        guitars.append(guitar)
+    return guitars
@@ -0,0 +1,113 @@
+import heapq
+from bisect import bisect_left, bisect_right
+
+
+def price_of(record, field='price'):
+    """Numeric value of a price field, treating missing prices as 0 like the reports do."""
+    try:
+        return float(record.get(field) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PriceIndex:
+    """
+    Records kept sorted by a price field so range filters are answered by binary search.
+    range() returns matching records in their original order, so results tie-break like the list-based filters did.
+    """
+
+    def __init__(self, records, field='price'):
+        self.field = field
+        entries = sorted((price_of(record, field), position, record) for position, record in enumerate(records))
+        self.prices = [entry[0] for entry in entries]
+        self.positions = [entry[1] for entry in entries]
+        self.records = [entry[2] for entry in entries]
+
+    def __len__(self):
+        return len(self.records)
+
+    def range(self, low=None, high=None, inclusive=False):
+        """Records with low < price < high (low <= price <= high if inclusive); None leaves that side open."""
+        if inclusive:
+            start = 0 if low is None else bisect_left(self.prices, low)
+            end = len(self.prices) if high is None else bisect_right(self.prices, high)
+        else:
+            start = 0 if low is None else bisect_right(self.prices, low)
+            end = len(self.prices) if high is None else bisect_left(self.prices, high)
+        hits = sorted(range(start, end), key=self.positions.__getitem__)
+        return [self.records[i] for i in hits]
+
+
+def top_k(records, k, key):
+    """The k records with the largest key, via a bounded heap; same order as sorted(records, key=key, reverse=True)[:k]."""
+    return heapq.nlargest(k, records, key=key)
+
+
+class TopK:
+    """
+    The k records with the largest key out of a stream, in a bounded min-heap; results() matches top_k on the
+    same records, including ties keeping the earlier record.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.pushed = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def floor(self):
+        """Smallest key held once k records are held (a new record must beat it to get in), else None."""
+        return self.heap[0][0] if self.k > 0 and len(self.heap) >= self.k else None
+
+    def push(self, key, record):
+        entry = (key, -self.pushed, record)
+        self.pushed += 1
+        if self.k <= 0:
+            return
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def results(self):
+        return [entry[2] for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def in_window(value, window):
+    """low < value < high for a (low, high) window; None (or a None bound) leaves that side open."""
+    low, high = window or (None, None)
+    return (low is None or low < value) and (high is None or value < high)
+
+
+def select_top_matches(matches, used_price=(500, 900), new_price=(800, 1500), min_score=70, k=100, index=None):
+    """
+    Best k matches by match score with used_price[0] < used price < used_price[1],
+    new_price[0] < new price < new_price[1] and a score above min_score. A window of None is open.
+    Pass a prebuilt PriceIndex of the matches by 'used_price' as index to skip sorting them again.
+    """
+    used_low, used_high = used_price or (None, None)
+    new_low, new_high = new_price or (None, None)
+    candidates = (index or PriceIndex(matches, 'used_price')).range(used_low, used_high)
+    candidates = (
+        match for match in candidates
+        if (new_low is None or new_low < match['new_price'])
+        and (new_high is None or match['new_price'] < new_high)
+        and match['match_score'] > min_score
+    )
+    return top_k(candidates, k, key=lambda match: match['match_score'])
+
+
+def top_discounts(guitars, discount, k=10, min_price=None, max_price=None, index=None):
+    """
+    The k guitars with the largest discount(guitar) > 0, optionally limited to min_price < price < max_price.
+    Each returned guitar gets its "real_discount" set. index is an optional prebuilt PriceIndex of the guitars.
+    """
+    if min_price is not None or max_price is not None:
+        guitars = (index or PriceIndex(guitars)).range(min_price, max_price)
+    discounted = ((discount(guitar), guitar) for guitar in guitars)
+    top = top_k((pair for pair in discounted if pair[0] > 0), k, key=lambda pair: pair[0])
+    for value, guitar in top:
+        guitar["real_discount"] = value
+    return [guitar for _, guitar in top]
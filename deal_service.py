@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import new_guitar_parsing
+import used_guitar_parsing
+import used_guitar_analysis
+import new_guitar_analysis
+from analysis import GuitarMatcher, bucket_by_brand, iter_matches
+from deal_queries import PriceIndex, select_top_matches, top_discounts
+from dedup import dedup_catalogs
+from dump_streaming import write_json_array
+from match_cache import MatchCache
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from listing import json_default, load_listings
+from new_guitar_parsing import iter_new_guitars, new_guitar_files
+from used_guitar_parsing import iter_used_guitars, used_guitar_jobs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(ROOT, 'data')
+
+# Defaults of the command-line reports, used when a query leaves a parameter out
+MATCH_DEFAULTS = {'used_min': 500, 'used_max': 900, 'new_min': 800, 'new_max': 1500, 'min_score': 70, 'top': 100}
+DISCOUNT_DEFAULTS = {'min_price': None, 'max_price': None, 'top': 10}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class DealCatalog:
+    """
+    One loaded snapshot of both catalogs with everything the queries need kept warm:
+    brand buckets, the matcher's normalized titles, every match report row and the price indexes.
+    A snapshot is never rebuilt in place: a reload builds a new one and swaps it in.
+    """
+
+    def __init__(self, used_guitars, new_guitars, match_cache_path=None, workers=-1, blocking=False):
+        self.used_guitars = used_guitars
+        self.new_guitars = new_guitars
+        self.loaded_at = time.time()
+
+        with METRICS.stage("bucket"):
+            self.new_guitars_by_brand = bucket_by_brand(new_guitars)
+        self.matcher = GuitarMatcher(self.new_guitars_by_brand)
+        if match_cache_path:
+            # Same file and options as analysis.py --incremental, so the two share stored matches
+            match_cache = MatchCache(match_cache_path, code_path=os.path.join(ROOT, 'analysis.py'),
+                                     options={'blocking': blocking, 'max_key_share': self.matcher.max_key_share})
+            best_matches = match_cache.match_all(self.matcher, used_guitars, workers=workers, blocking=blocking)
+            match_cache.save()
+        else:
+            best_matches = self.matcher.match_all(used_guitars, workers=workers, blocking=blocking)
+        self.matches = list(iter_matches(zip(used_guitars, best_matches)))
+
+        self.match_index = PriceIndex(self.matches, 'used_price')
+        self.used_index = PriceIndex(used_guitars)
+        self.new_index = PriceIndex(new_guitars)
+
+    def summary(self):
+        return {
+            'loaded_at': self.loaded_at,
+            'used_guitars': len(self.used_guitars),
+            'new_guitars': len(self.new_guitars),
+            'brands': len(self.new_guitars_by_brand),
+            'matches': len(self.matches)
+        }
+
+    def top_matches(self, used_min, used_max, new_min, new_max, min_score, top):
+        return select_top_matches(self.matches, (used_min, used_max), (new_min, new_max), min_score, top,
+                                  index=self.match_index)
+
+    def used_discounts(self, min_price, max_price, top):
+        return top_discounts(self.used_guitars, used_guitar_analysis.calculate_discount, top, min_price, max_price,
+                             index=self.used_index)
+
+    def new_discounts(self, min_price, max_price, top):
+        return top_discounts(self.new_guitars, new_guitar_analysis.calculate_discount, top, min_price, max_price,
+                             index=self.new_index)
+
+
+def combined_paths(data_folder):
+    combined = os.path.join(data_folder, 'combined')
+    return (os.path.join(combined, 'used_guitars_combined.json'),
+            os.path.join(combined, 'new_guitars_combined.json'))
+
+
+def load_combined(data_folder):
+    """Read the combined files written by the parsing scripts."""
+    used_path, new_path = combined_paths(data_folder)
+    with METRICS.stage("load"):
+        return load_listings(used_path), load_listings(new_path)
+
+
+def parse_dumps(data_folder):
+    """
+    Re-parse the raw dumps, reusing the parsing scripts' incremental caches so only new or changed dumps are read,
+    and rewrite the combined files so the command-line scripts see the same data.
+    """
+    used_cache = used_guitar_parsing.parse_cache(data_folder)
+    new_cache = new_guitar_parsing.parse_cache(data_folder)
+    used_guitars = list(iter_used_guitars(used_guitar_jobs(data_folder), used_cache))
+    new_guitars = list(iter_new_guitars(new_guitar_files(data_folder), cache=new_cache))
+    used_cache.save()
+    new_cache.save()
+
+    for path, guitars in zip(combined_paths(data_folder), (used_guitars, new_guitars)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as out_file:
+            write_json_array(guitars, out_file)
+        os.replace(path + '.tmp', path)
+    return used_guitars, new_guitars
+
+
+def dump_signature(data_folder):
+    """Names, sizes and modification times of the raw dumps; changes when dumps are added, removed or rewritten."""
+    paths = [path for path, _, _ in used_guitar_jobs(data_folder)] + new_guitar_files(data_folder)
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _number(query, name, defaults, cast=float):
+    """A numeric query parameter; missing means the default, an empty value (e.g. ?used_max=) means no limit."""
+    if name not in query:
+        return defaults[name]
+    value = query[name][-1].strip()
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number, got {value!r}")
+
+
+def _top(query, defaults):
+    top = _number(query, 'top', defaults, int)
+    if top is None or top < 0:
+        raise BadRequest("top must be a non-negative integer")
+    return top
+
+
+class DealService:
+    """
+    Holds the current DealCatalog and answers queries against it.
+    Queries run on the event loop (they only touch the warm indexes); loading and matching run in a worker
+    thread, and the finished snapshot replaces the old one in a single assignment, so requests are served
+    from the previous data until a reload completes.
+    """
+
+    def __init__(self, data_folder=DATA_FOLDER, workers=-1, blocking=False, incremental=False):
+        self.data_folder = data_folder
+        self.workers = workers
+        self.blocking = blocking
+        self.incremental = incremental
+        self.catalog = None
+        self.reloads = 0
+        self._reload_lock = asyncio.Lock()
+
+    def _build(self, source):
+        if source == 'dumps':
+            used_guitars, new_guitars = parse_dumps(self.data_folder)
+        else:
+            used_guitars, new_guitars = load_combined(self.data_folder)
+        used_guitars, new_guitars = dedup_catalogs(used_guitars, new_guitars)
+        match_cache_path = os.path.join(self.data_folder, '.match_cache', 'matches.json') if self.incremental else None
+        return DealCatalog(used_guitars, new_guitars, match_cache_path, self.workers, self.blocking)
+
+    async def reload(self, source='combined'):
+        """Rebuild the catalog from the combined files, or from the raw dumps with source='dumps', then swap it in."""
+        if source not in ('combined', 'dumps'):
+            raise BadRequest("source must be 'combined' or 'dumps'")
+        async with self._reload_lock:
+            start = time.perf_counter()
+            catalog = await asyncio.get_running_loop().run_in_executor(None, self._build, source)
+            self.catalog = catalog
+            self.reloads += 1
+            return dict(catalog.summary(), source=source, seconds=time.perf_counter() - start)
+
+    async def watch(self, interval):
+        """Poll the raw dumps and reload from them whenever one is added, removed or changed."""
+        signature = dump_signature(self.data_folder)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                current = dump_signature(self.data_folder)
+                if current != signature:
+                    summary = await self.reload('dumps')
+                    signature = current
+                    print(f"♻️ Dumps changed, reloaded {summary['used_guitars']} used and {summary['new_guitars']} new guitars")
+            except Exception as e:
+                print(f"❌ Error: reload failed: {e}")
+
+    async def dispatch(self, method, target):
+        """Route one request to (status, JSON-serializable body)."""
+        url = urlsplit(target)
+        query = parse_qs(url.query, keep_blank_values=True)
+        path = url.path.rstrip('/') or '/'
+        catalog = self.catalog
+
+        if path == '/reload':
+            if method != 'POST':
+                return 405, {'error': "use POST /reload"}
+            return 200, await self.reload(query.get('source', ['combined'])[-1])
+
+        if method != 'GET':
+            return 405, {'error': f"use GET {path}"}
+        if path in ('/', '/health'):
+            return 200, dict(catalog.summary(), status='ok', reloads=self.reloads)
+        if path == '/matches':
+            return 200, catalog.top_matches(
+                _number(query, 'used_min', MATCH_DEFAULTS), _number(query, 'used_max', MATCH_DEFAULTS),
+                _number(query, 'new_min', MATCH_DEFAULTS), _number(query, 'new_max', MATCH_DEFAULTS),
+                _number(query, 'min_score', MATCH_DEFAULTS) or 0, _top(query, MATCH_DEFAULTS))
+        if path in ('/used/discounts', '/new/discounts'):
+            find = catalog.used_discounts if path.startswith('/used') else catalog.new_discounts
+            return 200, find(_number(query, 'min_price', DISCOUNT_DEFAULTS), _number(query, 'max_price', DISCOUNT_DEFAULTS),
+                             _top(query, DISCOUNT_DEFAULTS))
+        return 404, {'error': f"no endpoint {path}"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it open between requests unless asked to close."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.split()
+                except ValueError:
+                    break
+                # Request bodies aren't used by any endpoint; read and drop them to keep the connection in sync
+                if int(headers.get('content-length') or 0):
+                    await reader.readexactly(int(headers['content-length']))
+
+                with METRICS.stage("request"):
+                    try:
+                        status, body = await self.dispatch(method, target)
+                    except BadRequest as e:
+                        status, body = 400, {'error': str(e)}
+                    except Exception as e:
+                        status, body = 500, {'error': str(e)}
+                    payload = json.dumps(body, ensure_ascii=False, default=json_default).encode('utf-8')
+                METRICS.count("requests")
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"{version if version.startswith('HTTP/') else 'HTTP/1.1'} {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+
+async def serve(service, host, port, watch=None):
+    summary = await service.reload('dumps' if watch else 'combined')
+    print(f"✅ Loaded {summary['used_guitars']} used and {summary['new_guitars']} new guitars "
+          f"({summary['matches']} matches) in {summary['seconds']:.2f}s")
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    if watch:
+        asyncio.create_task(service.watch(watch))
+    print(f"🎸 Serving deals on http://{host}:{port}/ (GET /matches, /used/discounts, /new/discounts, /health; POST /reload)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve deal queries over HTTP from catalogs kept loaded in memory.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=-1,
+                        help="Cores used for batch matching (-1 = all cores)")
+    parser.add_argument("--blocking", action="store_true",
+                        help="Only fuzzy-score new guitars that share a title token or model series with the used guitar")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse stored matches on (re)load and only rematch used listings that changed")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="Re-parse the raw dumps and reload whenever they change, checking this often")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    service = DealService(workers=args.workers, blocking=args.blocking, incremental=args.incremental)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.watch))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    finish_metrics(args)
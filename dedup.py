@@ -0,0 +1,40 @@
+from hashlib import blake2b
+
+from metrics import METRICS
+
+
+def listing_id(guitar):
+    """Stable ID of a listing across dumps: its slug (Sweetwater slug or Guitar Center seoUrl), else its URL."""
+    return guitar.get('slug') or guitar.get('url')
+
+
+def id_key(listing):
+    """8-byte hash of a listing ID; a set of these is much smaller than a set of the slugs themselves."""
+    return blake2b(listing.encode('utf-8'), digest_size=8).digest()
+
+
+def dedup_listings(guitars):
+    """
+    Yield guitars in order, dropping any whose ID was already seen (the numbered dumps overlap).
+    Listings without a slug or URL have no stable ID and are always kept.
+    """
+    seen = set()
+    for guitar in guitars:
+        listing = listing_id(guitar)
+        if listing:
+            key = id_key(listing)
+            if key in seen:
+                METRICS.count("duplicates_dropped")
+                continue
+            seen.add(key)
+        yield guitar
+
+
+def dedup_catalogs(used_guitars, new_guitars):
+    """
+    The used and new catalogs as lists holding each listing once, timed as the "dedup" stage.
+    The numbered dumps overlap (a listing still up between two collection runs is in both), so every reader that
+    matches or serves listings dedups them first; otherwise one listing is matched, and reported, several times.
+    """
+    with METRICS.stage("dedup"):
+        return list(dedup_listings(used_guitars)), list(dedup_listings(new_guitars))
@@ -0,0 +1,256 @@
+import json
+import re
+
+from listing import json_default
+
+CHUNK_SIZE = 64 * 1024
+
+_NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+# Next character that changes the scanner's state inside a container, inside a string, or after a scalar
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING_STOP = re.compile(r'["\\]')
+_SCALAR_STOP = re.compile(r'[,\]}\s]')
+
+
+class NotADumpError(ValueError):
+    """The file is JSON, but not shaped like the Algolia dump it was read as."""
+
+
+class _JsonStream:
+    """Incremental reader over a JSON document that only keeps a small window of text in memory."""
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read another chunk into the buffer, dropping text that was already consumed."""
+        if self.eof:
+            return False
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character without consuming it ('' at end of input)."""
+        while True:
+            match = _NON_WHITESPACE.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}.")
+        self.pos += 1
+
+    def _value_end(self):
+        """Return the index just past the value starting at self.pos, reading more input as needed."""
+        i = self.pos
+        scalar = self.buf[i] not in '"{['
+        depth = 0
+        in_string = False
+        while True:
+            if scalar:
+                pattern = _SCALAR_STOP
+            else:
+                pattern = _STRING_STOP if in_string else _STRUCTURE
+            match = pattern.search(self.buf, i)
+            if match:
+                j = match.start()
+                c = self.buf[j]
+                if scalar:
+                    return j
+                if in_string and c == "\\":
+                    if j + 1 < len(self.buf):
+                        i = j + 2
+                        continue
+                    i = j  # Escaped character not read yet; rescan from the backslash
+                else:
+                    i = j + 1
+                    if in_string:
+                        in_string = False
+                        if depth == 0:
+                            return i
+                    elif c == '"':
+                        in_string = True
+                    elif c in "{[":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return i
+                    continue
+            else:
+                i = len(self.buf)
+            # Keep the scan position valid if _fill() compacts the buffer
+            offset = self.pos
+            if not self._fill():
+                if scalar:
+                    return i
+                raise ValueError("Unexpected end of JSON stream.")
+            i -= offset - self.pos
+
+    def skip_value(self):
+        self.peek()
+        self.pos = self._value_end()
+
+    def read_value(self):
+        self.peek()
+        end = self._value_end()
+        value = json.loads(self.buf[self.pos:end])
+        self.pos = end
+        return value
+
+    def iter_array(self):
+        """Consume an array, yielding once per element with the stream positioned on that element."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            self.peek()
+            start = self.pos
+            yield
+            if self.pos == start:
+                self.skip_value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {sep!r}.")
+
+    def iter_object(self):
+        """Consume an object, yielding each key with the stream positioned on its value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            self.peek()
+            start = self.pos
+            yield key
+            if self.pos == start:
+                self.skip_value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or '}}' in JSON object, found {sep!r}.")
+
+
+def _read_hit(stream, fields):
+    if fields is None:
+        return stream.read_value()
+    hit = {}
+    for key in stream.iter_object():
+        if key in fields:
+            hit[key] = stream.read_value()
+    return hit
+
+
+def _iter_result_hits(stream, fields):
+    for _ in stream.iter_array():
+        if stream.peek() != "{":
+            continue
+        for key in stream.iter_object():
+            if key == "hits" and stream.peek() == "[":
+                for _ in stream.iter_array():
+                    if stream.peek() == "{":
+                        yield _read_hit(stream, fields)
+
+
+def _has_results(stream):
+    """Whether the object at the stream's position has a "results" array; consumes the object up to that key."""
+    for key in stream.iter_object():
+        if key == "results" and stream.peek() == "[":
+            return True
+    return False
+
+
+def _iter_dump_hits(f, stream, fields, start):
+    with f:
+        if start == "[":
+            yield from _iter_result_hits(stream, fields)
+        else:
+            for key in stream.iter_object():
+                if key == "results" and stream.peek() == "[":
+                    yield from _iter_result_hits(stream, fields)
+
+
+def iter_hits(file_path, fields=None, allow_list=True):
+    """
+    Stream the hits of an Algolia multi-query dump (results[*].hits[*]) one at a time.
+    Only the keys listed in `fields` are decoded; everything else (highlight results, SKU
+    properties, images) is skipped without being built. Pass fields=None to keep whole hits.
+    With allow_list=False the dump must be an object with a "results" array, as the used parser's json.load path
+    checks; otherwise a dump without "results" simply has no hits.
+    The top-level shape is checked up front, so NotADumpError is raised here rather than mid-iteration.
+    """
+    fields = set(fields) if fields is not None else None
+    f = open(file_path, 'r', encoding='utf-8')
+    stream = _JsonStream(f)
+    start = stream.peek()
+    if start == "{" and not allow_list:
+        # "results" normally comes first in a dump, so this reads little before starting over
+        try:
+            found = _has_results(stream)
+        except ValueError:
+            f.close()
+            raise
+        f.seek(0)
+        stream = _JsonStream(f)
+        if not found:
+            start = None
+    if start == "{" or (start == "[" and allow_list):
+        return _iter_dump_hits(f, stream, fields, start)
+    f.close()
+    raise NotADumpError(f"{file_path} doesn't look like an Algolia results dump.")
+
+
+class JsonArrayWriter:
+    """
+    Writes records into a JSON array one at a time; call close() to finish the array.
+    The output is byte-identical to json.dump(records, out_file, indent=indent, ensure_ascii=False).
+    """
+
+    def __init__(self, out_file, indent=2):
+        self.out_file = out_file
+        self.pad = " " * indent
+        self.indent = indent
+        self.count = 0
+
+    def write(self, record):
+        self.out_file.write("[\n" + self.pad if self.count == 0 else ",\n" + self.pad)
+        text = json.dumps(record, indent=self.indent, ensure_ascii=False, default=json_default)
+        self.out_file.write(text.replace("\n", "\n" + self.pad))
+        self.count += 1
+
+    def close(self):
+        self.out_file.write("\n]" if self.count else "[]")
+
+
+def write_json_array(records, out_file, indent=2):
+    """Write an iterable of records as a JSON array, one record at a time, and return how many were written."""
+    writer = JsonArrayWriter(out_file, indent)
+    for record in records:
+        writer.write(record)
+    writer.close()
+    return writer.count
@@ -0,0 +1,155 @@
+import json
+import math
+import sys
+from collections.abc import Mapping
+
+# Keys of a parsed listing, in the order the parsers have always emitted them; shipping_price is only set on
+# Sweetwater listings
+FIELDS = ("title", "brand", "price", "original_price", "price_drop", "condition", "location", "slug", "url",
+          "shipping_available", "local_pickup_available", "store", "shipping_price")
+PRICE_FIELDS = ("price", "original_price", "price_drop", "shipping_price")
+# Low-cardinality strings shared by thousands of listings
+INTERNED_FIELDS = ("brand", "condition", "location", "store")
+
+_FIELD_SET = frozenset(FIELDS)
+_BITS = {field: 1 << i for i, field in enumerate(FIELDS)}
+_MISSING = object()
+
+
+def to_cents(value):
+    """Integer cents of a price, treating missing or unparsable prices as 0 like the reports do."""
+    try:
+        return round(float(value or 0) * 100)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class Listing(Mapping):
+    """
+    Compact parsed listing: a read-mostly mapping with the same keys, values and key order as the dict the
+    parsers used to build, at a fraction of the memory.
+    Fields live in __slots__, brand/condition/location/store are interned, and prices are kept as integer
+    cents (remembering which were floats, so listing["price"] and JSON output are unchanged).
+    Keys outside FIELDS (e.g. "real_discount" set by the reports) go into a small overflow dict.
+    """
+
+    __slots__ = FIELDS + ("_floats", "_absent", "_extra")
+
+    def __init__(self, title, brand, price, original_price, price_drop, condition, location, slug, url,
+                 shipping_available, local_pickup_available, store, shipping_price=_MISSING):
+        self._floats = 0
+        self._absent = 0
+        self._extra = None
+        self.title = title
+        self.brand = _intern(brand)
+        self.condition = _intern(condition)
+        self.location = _intern(location)
+        self.store = _intern(store)
+        self.slug = slug
+        self.url = url
+        self.shipping_available = shipping_available
+        self.local_pickup_available = local_pickup_available
+        self._set_price("price", price)
+        self._set_price("original_price", original_price)
+        self._set_price("price_drop", price_drop)
+        if shipping_price is _MISSING:
+            self.shipping_price = None
+            self._absent |= _BITS["shipping_price"]
+        else:
+            self._set_price("shipping_price", shipping_price)
+
+    def _set_price(self, field, value):
+        bit = _BITS[field]
+        self._floats &= ~bit
+        if type(value) is int:
+            value *= 100
+        elif type(value) is float and math.isfinite(value) and round(value * 100) / 100 == value:
+            value = round(value * 100)
+            self._floats |= bit
+        # Anything else (None, strings, sub-cent floats) is kept as is
+        setattr(self, field, value)
+
+    def cents(self, field):
+        """A price field in integer cents (0 if missing or not a number)."""
+        value = getattr(self, field)
+        return value if type(value) is int else to_cents(value)
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        Listing for a parsed record (e.g. a line of a combined file); records with other keys or key order
+        are returned unchanged, so serializing them again can't reorder anything.
+        """
+        keys = tuple(record)
+        if keys != FIELDS and keys != FIELDS[:-1]:
+            return record
+        return cls(*record.values())
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            bit = _BITS[key]
+            if self._absent & bit:
+                raise KeyError(key)
+            value = getattr(self, key)
+            if key in PRICE_FIELDS and type(value) is int:
+                return value / 100 if self._floats & bit else value // 100
+            return value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            self._absent &= ~_BITS[key]
+            if key in PRICE_FIELDS:
+                self._set_price(key, value)
+            else:
+                setattr(self, key, _intern(value) if key in INTERNED_FIELDS else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return not self._absent & _BITS[key]
+        return bool(self._extra) and key in self._extra
+
+    def __iter__(self):
+        for field in FIELDS:
+            if not self._absent & _BITS[field]:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return len(FIELDS) - self._absent.bit_count() + len(self._extra or ())
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return f"Listing({self.to_dict()!r})"
+
+
+def json_default(obj):
+    """`default=` hook so json.dump/dumps write Listings exactly like the dicts they replace."""
+    if isinstance(obj, Listing):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def load_listings(file_path):
+    """Load a combined JSON file with each parsed record decoded straight into a Listing."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f, object_hook=Listing.from_dict)
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+from parse_cache import file_digest
+
+
+def listing_key(guitar):
+    """Stable ID for a listing: its slug (Sweetwater slug or Guitar Center seoUrl), else its URL, else its title."""
+    return guitar.get('slug') or guitar.get('url') or f"title:{guitar.get('title')}"
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def used_digest(used):
+    """Hash of the used listing fields that matching and scoring read."""
+    return _digest([used.get('title'), used.get('brand'), used.get('price')])
+
+
+def bucket_digest(guitars):
+    """Hash of a new-catalog brand bucket, in bucket order, over the fields matching and scoring read."""
+    return _digest([[listing_key(g), g.get('title'), g.get('price')] for g in guitars])
+
+
+class MatchCache:
+    """
+    Persisted match results keyed by used listing ID.
+    A used listing is rematched only if it is new, its title/brand/price changed, or the new-catalog bucket
+    for its brand changed; everything else reuses the stored match (by position in the unchanged bucket).
+    """
+
+    def __init__(self, cache_path, options=None, code_path=None):
+        self.cache_path = cache_path
+        self.fingerprint = _digest({
+            'options': options or {},
+            'code': file_digest(code_path) if code_path else None
+        })
+        self.brands = {}
+        self.used = {}
+        self.reused = 0
+        self.rematched = 0
+
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('fingerprint') == self.fingerprint:
+                self.brands = stored.get('brands', {})
+                self.used = stored.get('used', {})
+
+    def match_all(self, matcher, used_guitars, **match_kwargs):
+        """Drop-in for matcher.match_all(used_guitars, ...) that only rematches stale listings."""
+        new_guitars_by_brand = matcher.new_guitars_by_brand
+        brands = {brand: bucket_digest(guitars) for brand, guitars in new_guitars_by_brand.items()}
+        changed_brands = {brand for brand in set(brands) | set(self.brands) if brands.get(brand) != self.brands.get(brand)}
+
+        results = [None] * len(used_guitars)
+        stale = []
+        used_entries = {}
+        for i, used in enumerate(used_guitars):
+            key = listing_key(used)
+            digest = used_digest(used)
+            entry = self.used.get(key)
+            if entry and entry['digest'] == digest and used.get('brand') not in changed_brands:
+                brand, idx = entry['brand'], entry['index']
+                matched_guitar = new_guitars_by_brand[brand][idx] if idx is not None else None
+                results[i] = (matched_guitar, entry['score'])
+                used_entries[key] = entry
+                self.reused += 1
+            else:
+                stale.append(i)
+
+        fresh = matcher.match_all([used_guitars[i] for i in stale], **match_kwargs)
+        self.rematched += len(stale)
+        positions = {}
+        for i, (matched_guitar, score) in zip(stale, fresh):
+            used = used_guitars[i]
+            brand = used.get('brand')
+            idx = None
+            if matched_guitar is not None:
+                # Position of the match in its bucket; identity keeps duplicate listings apart
+                if brand not in positions:
+                    positions[brand] = {id(g): j for j, g in enumerate(new_guitars_by_brand[brand])}
+                idx = positions[brand][id(matched_guitar)]
+            results[i] = (matched_guitar, score)
+            used_entries[listing_key(used)] = {
+                'digest': used_digest(used),
+                'brand': brand,
+                'index': idx,
+                'score': score
+            }
+
+        self.brands = brands
+        self.used = used_entries
+        return results
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'brands': self.brands, 'used': self.used}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+_DISABLED = nullcontext()
+
+
+class _Stage:
+    """
+    Times one pass through a stage and, if tracing, the memory it allocated (net) and its peak.
+    tracemalloc has a single process-wide peak, so a stage opening inside another first folds the peak so far
+    into the enclosing stage before resetting it, and hands its own peak back to it when it closes.
+    """
+
+    __slots__ = ("metrics", "name", "start", "memory_start", "peak")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        if self.metrics.trace_allocations:
+            open_stages = self.metrics.open_stages
+            if open_stages:
+                parent = open_stages[-1]
+                parent.peak = max(parent.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.memory_start = self.peak = tracemalloc.get_traced_memory()[0]
+            open_stages.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stage = self.metrics.stages.setdefault(self.name, {"calls": 0, "seconds": 0.0})
+        stage["calls"] += 1
+        stage["seconds"] += elapsed
+        if self.metrics.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            open_stages = self.metrics.open_stages
+            open_stages.remove(self)
+            if open_stages:
+                open_stages[-1].peak = max(open_stages[-1].peak, self.peak)
+            stage["allocated_bytes"] = stage.get("allocated_bytes", 0) + current - self.memory_start
+            stage["peak_bytes"] = max(stage.get("peak_bytes", 0), self.peak - self.memory_start)
+        return False
+
+
+class Metrics:
+    """
+    Opt-in per-stage timings, allocations and counters for one run, written out as a single JSON document.
+    While disabled every call is a cheap no-op, so instrumented code paths cost nothing by default.
+    Work done in process-pool workers is timed in the parent as time spent waiting for results.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_allocations = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        # Stages currently open, innermost last
+        self.open_stages = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def enable(self, trace_allocations=True):
+        self.enabled = True
+        self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.reset()
+
+    def stage(self, name):
+        """Context manager timing a stage; repeated passes through the same stage are summed."""
+        return _Stage(self, name) if self.enabled else _DISABLED
+
+    def timed(self, name, iterable):
+        """Yield from iterable, counting the time spent producing each item towards the named stage."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def counted(self, name, iterable):
+        """Pass items through, adding one to the named counter per item (returns iterable itself while disabled)."""
+        if not self.enabled:
+            return iterable
+        return self._counted(name, iterable)
+
+    def _counted(self, name, iterable):
+        for item in iterable:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            yield item
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def document(self, run=None):
+        hits = self.counters.get("normalize_cache_hits", 0)
+        misses = self.counters.get("normalize_cache_misses", 0)
+        return {
+            "run": run or os.path.basename(sys.argv[0]),
+            "started_at": self.started_at,
+            "wall_seconds": time.perf_counter() - self._start,
+            "allocations_traced": self.trace_allocations,
+            "stages": self.stages,
+            "counters": self.counters,
+            "derived": {
+                "normalize_cache_hit_rate": hits / (hits + misses) if hits + misses else None
+            }
+        }
+
+    def write(self, path, run=None):
+        """Write the metrics document for this run as JSON ('-' for stdout)."""
+        document = self.document(run)
+        if path == "-":
+            print(json.dumps(document, indent=2))
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+
+
+# Process-wide metrics, disabled unless a script is run with --metrics
+METRICS = Metrics()
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Record per-stage timings, allocations and counters and write them to PATH as JSON ('-' for stdout)")
+    parser.add_argument("--metrics-no-alloc", action="store_true",
+                        help="With --metrics, skip allocation tracing (tracemalloc slows the run down)")
+
+
+def start_metrics(args):
+    if args.metrics:
+        METRICS.enable(trace_allocations=not args.metrics_no_alloc)
+
+
+def finish_metrics(args):
+    if args.metrics:
+        METRICS.write(args.metrics)
@@ -1,5 +1,9 @@
+import argparse
 import json
 import os
+import catalog_db
+import columnar
+from deal_queries import top_discounts
 
 # Load parsed guitar data
 def load_parsed_guitars(file_path='./data/combined/new_guitars_combined.json'):
@@ -23,20 +27,38 @@ def calculate_discount(guitar):
 
 # Main analysis
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the new guitars with the biggest real discounts.")
+    parser.add_argument("--top", type=int, default=10, help="Number of guitars to show")
+    parser.add_argument("--min-price", type=float, help="Only consider guitars priced above this")
+    parser.add_argument("--max-price", type=float, help="Only consider guitars priced below this")
+    parser.add_argument("--brand", help="Only consider guitars of this brand")
+    parser.add_argument("--condition", help="Only consider guitars in this condition")
+    parser.add_argument("--store", help="Only consider guitars from this store")
+    parser.add_argument("--sqlite", nargs="?", const=catalog_db.DEFAULT_PATH, metavar="PATH",
+                        help="Query the SQLite catalog written with --sqlite instead of loading the combined file")
+    parser.add_argument("--columnar", nargs="?", const='./data/combined/new_guitars_combined.cols', metavar="PATH",
+                        help="Scan the binary catalog written with --columnar instead of loading the combined file")
+    args = parser.parse_args()
+    filters = {'brand': args.brand, 'condition': args.condition, 'store': args.store}
+
     try:
-        guitars = load_parsed_guitars()
-        
-        # Add real discount value to each guitar
-        for guitar in guitars:
-            guitar["real_discount"] = calculate_discount(guitar)
-        
-        # Filter guitars with a real discount > 0
-        guitars_with_discount = [g for g in guitars if g["real_discount"] > 0]
-        
-        # Sort by the biggest real discount
-        top_discounted = sorted(guitars_with_discount, key=lambda g: g["real_discount"], reverse=True)[:10]
+        if args.sqlite:
+            # Filters, ordering and the limit run as one indexed query; only the top rows are decoded
+            with catalog_db.open_existing(args.sqlite) as conn:
+                top_discounted = catalog_db.query_top_discounts(conn, 'new', args.top, args.min_price, args.max_price,
+                                                                **filters)
+        elif args.columnar:
+            # Only the price and filter columns are read; listings are built for the top rows alone
+            with columnar.ColumnarCatalog(args.columnar) as catalog:
+                top_discounted = columnar.top_discounts(catalog, args.top, args.min_price, args.max_price, **filters)
+        else:
+            guitars = load_parsed_guitars()
+            guitars = [g for g in guitars if all(value is None or g.get(field) == value for field, value in filters.items())]
+
+            # Biggest real discounts (> 0) within the price window, kept in a bounded heap
+            top_discounted = top_discounts(guitars, calculate_discount, args.top, args.min_price, args.max_price)
         
-        print("Top 10 new guitars with the biggest real discounts:\n")
+        print(f"Top {args.top} new guitars with the biggest real discounts:\n")
         for idx, guitar in enumerate(top_discounted, 1):
             print(f"{idx}. {guitar['title']} - {guitar['brand']}")
             print(f"   Original Price: ${guitar['original_price']}")
@@ -1,5 +1,17 @@
+import argparse
 import json
 import os
+from contextlib import nullcontext
+from functools import partial
+import catalog_db
+import columnar
+import dump_streaming
+import listing
+from dump_streaming import iter_hits, write_json_array
+from listing import Listing, json_default
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from parallel_ingest import ParallelParser, resolve_workers
+from parse_cache import ParseCache, source_fingerprint
 
 BASE_SITE_URL = "https://www.guitarcenter.com"
 
@@ -18,6 +30,39 @@ def calculate_price_drop(original_price, price):
         pass
     return 0
 
+# Hit keys read by parse_new_guitar_hit; everything else in a dump is skipped when streaming
+NEW_HIT_FIELDS = ("displayName", "brand", "price", "listPrice", "seoUrl", "retailOnly", "condition")
+
+def parse_new_guitar_hit(item):
+    original_price = item.get("listPrice") or 0
+    price = item.get("price") or 0
+    
+    slug = item.get("seoUrl")
+    full_url = f"{BASE_SITE_URL}{slug}" if slug else None
+
+    retail_only = item.get("retailOnly", False)
+    if retail_only:
+        local_pickup_available = True
+        shipping_available = False
+    else:
+        local_pickup_available = False
+        shipping_available = True
+    
+    return Listing(
+        title=item.get("displayName"),
+        brand=item.get("brand"),
+        price=price,
+        original_price=original_price,
+        price_drop=calculate_price_drop(original_price, price),
+        condition=item.get("condition", {}).get("lvl0"),
+        location=None,
+        slug=slug,
+        url=full_url,
+        shipping_available=shipping_available,
+        local_pickup_available=local_pickup_available,
+        store="Guitar Center"
+    )
+
 def parse_new_guitars(data):
     guitars = []
 
@@ -26,66 +71,108 @@ def parse_new_guitars(data):
 
     for result in results:
         for item in result.get("hits", []):
-            original_price = item.get("listPrice") or 0
-            price = item.get("price") or 0
-            
-            slug = item.get("seoUrl")
-            full_url = f"{BASE_SITE_URL}{slug}" if slug else None
-
-            retail_only = item.get("retailOnly", False)
-            if retail_only:
-                local_pickup_available = True
-                shipping_available = False
-            else:
-                local_pickup_available = False
-                shipping_available = True
-            
-            guitar_info = {
-                "title": item.get("displayName"),
-                "brand": item.get("brand"),
-                "price": price,
-                "original_price": original_price,
-                "price_drop": calculate_price_drop(original_price, price),
-                "condition": item.get("condition", {}).get("lvl0"),
-                "location": None,
-                "slug": slug,
-                "url": full_url,
-                "shipping_available": shipping_available,
-                "local_pickup_available": local_pickup_available,
-                "store": "Guitar Center"
-            }
-            guitars.append(guitar_info)
+            guitars.append(parse_new_guitar_hit(item))
     
     return guitars
 
+def stream_new_guitars(file_path):
+    """Return an iterator of parsed new guitars from a dump, read one hit at a time without loading the whole file."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} not found.")
+    return (parse_new_guitar_hit(item) for item in iter_hits(file_path, NEW_HIT_FIELDS))
+
+def read_new_guitar_file(file_path, stream=False):
+    """Parse one new guitar dump, either streamed or loaded whole with json.load."""
+    if stream:
+        return METRICS.timed("parse", stream_new_guitars(file_path))
+    with METRICS.stage("load"):
+        data = load_json_file(file_path)
+    with METRICS.stage("parse"):
+        return parse_new_guitars(data)
+
+def new_guitar_files(data_folder):
+    """Full paths of all new guitar dumps in the data folder, in sorted filename order."""
+    json_files = sorted(f for f in os.listdir(data_folder) if f.startswith("new_guitars") and f.endswith(".json"))
+    return [os.path.join(data_folder, file_name) for file_name in json_files]
+
+def parse_cache(data_folder):
+    """The incremental-parse cache for new guitar dumps, invalidated whenever the parsing code changes."""
+    return ParseCache(os.path.join(data_folder, '.parse_cache', 'new'),
+                      source_fingerprint(__file__, listing.__file__, dump_streaming.__file__))
+
+def iter_new_guitars(file_paths, stream=False, cache=None, pool=None):
+    """
+    Yield parsed new guitars from the given dumps in order.
+    With a ParseCache only new or changed dumps are parsed; with a ParallelParser they are parsed in worker processes.
+    """
+    read_file = partial(read_new_guitar_file, stream=stream)
+    if pool:
+        # Queue every dump that actually needs parsing; results are still merged in file order
+        for file_path in file_paths:
+            if not cache or cache.is_stale(file_path):
+                pool.submit(read_file, file_path)
+
+    for file_path in file_paths:
+        reader = pool.result if pool and file_path in pool.futures else read_file
+        parsed = cache.records(file_path, reader) if cache else reader(file_path)
+        yield from METRICS.counted("hits_seen", parsed)
+
 if __name__ == "__main__":
-    try:
-        all_guitars = []
+    parser = argparse.ArgumentParser(description="Parse and combine new guitar dumps.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream hits one at a time instead of loading each dump with json.load")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-parse dumps that are new or changed since the last run, reusing cached output for the rest")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parse dumps in a pool of this many processes (-1 = all cores, 1 = serial)")
+    parser.add_argument("--sqlite", nargs="?", const=catalog_db.DEFAULT_PATH, metavar="PATH",
+                        help="Also write the parsed listings into a SQLite catalog (default data/catalog.sqlite)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Also write a memory-mappable binary catalog, new_guitars_combined.cols")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
 
+    try:
         # Get the absolute path for the data folder
         data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
-        # Get all new guitar JSON files
-        json_files = sorted(f for f in os.listdir(data_folder) if f.startswith("new_guitars") and f.endswith(".json"))
+        cache = None
+        if args.incremental:
+            cache = parse_cache(data_folder)
 
-        for file_name in json_files:
-            file_path = os.path.join(data_folder, file_name)  # Get the full path
-            data = load_json_file(file_path)
-            parsed = parse_new_guitars(data)
-            all_guitars.extend(parsed)
-        
-        # Define the output folder and path
+        workers = resolve_workers(args.workers)
+        pool = ParallelParser(workers) if workers > 1 else None
 
+        guitars = iter_new_guitars(new_guitar_files(data_folder), args.stream, cache, pool)
+        
         # Save all combined data to the correct location
         output_folder = os.path.join(data_folder, 'combined')
         os.makedirs(output_folder, exist_ok=True)
         output_path = os.path.join(output_folder, 'new_guitars_combined.json')
 
         # Save the combined result
-        with open(output_path, "w", encoding="utf-8") as out_file:
-            json.dump(all_guitars, out_file, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Parsed and combined {len(all_guitars)} new guitars into new_guitars_combined.json")
+        with pool or nullcontext(), catalog_db.transaction(args.sqlite) if args.sqlite else nullcontext() as conn, \
+                open(output_path + ".tmp", "w", encoding="utf-8") as out_file:
+            if conn:
+                guitars = catalog_db.tee_listings(guitars, conn, 'new')
+            if args.columnar:
+                guitars = columnar.tee_columnar(guitars, columnar.columnar_path(output_path))
+            if args.stream:
+                count = write_json_array(guitars, out_file)
+            else:
+                all_guitars = list(guitars)
+                json.dump(all_guitars, out_file, indent=2, ensure_ascii=False, default=json_default)
+                count = len(all_guitars)
+        # Written beside the combined file and moved over it once complete, so a failed parse keeps the last good one
+        os.replace(output_path + ".tmp", output_path)
+
+        if cache:
+            cache.save()
+            print(f"♻️ Reused {cache.reused} cached dump(s), parsed {cache.parsed} new or changed dump(s)")
+
+        print(f"✅ Parsed and combined {count} new guitars into new_guitars_combined.json")
+        finish_metrics(args)
     
     except Exception as e:
         print(f"❌ Error: {e}")
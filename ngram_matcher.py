@@ -0,0 +1,178 @@
+import math
+
+import numpy as np
+from rapidfuzz import fuzz
+from scipy import sparse
+
+from analysis import calculate_match_score, normalize_title
+from metrics import METRICS
+
+NGRAM_SIZE = 3
+# n-grams found in more than this share of the new titles (" gu", "tar", ...) barely rank anything but would make
+# every query row of the similarity product dense, so they're left out of the vocabulary
+MAX_DF = 0.5
+
+# Words that don't identify a maker, so sharing only these doesn't make two brands the same
+GENERIC_BRAND_WORDS = {"guitars", "guitar", "by", "the", "instruments", "custom", "shop", "research"}
+
+
+def match_text(title, brand):
+    """
+    Text that gets vectorized: the brand's words followed by the title's, normalized and without repeats,
+    so "EVH" / "Fender EVH" or "Schecter" / "Schecter Guitar Research" still share most of their n-grams.
+    """
+    words = normalize_title(brand or "").split() + normalize_title(title).split()
+    return " ".join(dict.fromkeys(words))
+
+
+def brand_words(brand):
+    """Distinctive words of a brand; two listings' brands are compatible if either is empty or they share one."""
+    return frozenset(normalize_title(brand or "").split()) - GENERIC_BRAND_WORDS
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """Character n-grams of each word padded with spaces (so short words like "sg" still get n-grams)."""
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        grams.extend(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+    return grams
+
+
+class NgramMatcher:
+    """
+    Brand-agnostic matcher over the whole new catalog.
+    Each distinct new title is a sparse TF-IDF vector of character n-grams (sublinear tf, L2-normalized), so a
+    batch of used listings finds its top-k nearest new titles with one sparse matrix product instead of an
+    exact brand lookup. Only those k candidates (and their colour variants) go through the fuzzy threshold
+    and calculate_match_score, which picks the match.
+    Brands only have to be compatible ("EVH" / "Fender EVH"); a used listing without one can match any brand.
+    """
+
+    def __init__(self, new_guitars, k=20, max_df=MAX_DF):
+        self.new_guitars = new_guitars
+        self.k = k
+        self.titles = [g['title'] for g in new_guitars]
+        self.prices = [g.get('price') or 0 for g in new_guitars]
+        with METRICS.stage("normalize"):
+            self.normalized = [normalize_title(g['title'], g.get('brand')) for g in new_guitars]
+            self.brand_words = [brand_words(g.get('brand')) for g in new_guitars]
+            texts = [match_text(g['title'], g.get('brand')) for g in new_guitars]
+
+        # Distinct texts (in first-seen order) and the catalog indices of each one's variants
+        groups = {}
+        for idx, text in enumerate(texts):
+            groups.setdefault(text, []).append(idx)
+        self.texts = list(groups)
+        self.variants = list(groups.values())
+
+        with METRICS.stage("vectorize"):
+            df = {}
+            for text in self.texts:
+                for gram in set(char_ngrams(text)):
+                    df[gram] = df.get(gram, 0) + 1
+            limit = max_df * len(self.texts)
+            self.vocabulary = {}
+            idf = []
+            for gram, count in df.items():
+                if count <= limit:
+                    self.vocabulary[gram] = len(self.vocabulary)
+                    # Smoothed IDF, as if one extra title contained every n-gram
+                    idf.append(math.log((1 + len(self.texts)) / (1 + count)) + 1)
+            self.idf = np.asarray(idf)
+            self.matrix_t = self._vectors([self._count(text) for text in self.texts]).T.tocsr()
+
+    def _count(self, text):
+        """n-gram column -> count for a text, skipping n-grams outside the vocabulary."""
+        row = {}
+        for gram in char_ngrams(text):
+            col = self.vocabulary.get(gram)
+            if col is not None:
+                row[col] = row.get(col, 0) + 1
+        return row
+
+    def _vectors(self, counts):
+        """CSR matrix of L2-normalized TF-IDF rows from _count results."""
+        indptr = [0]
+        indices = []
+        data = []
+        for row in counts:
+            indices.extend(row)
+            data.extend(1 + math.log(c) for c in row.values())
+            indptr.append(len(indices))
+        indices = np.asarray(indices, dtype=np.int64)
+        data = np.asarray(data) * self.idf[indices]
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(counts), len(self.vocabulary)))
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ matrix
+
+    def nearest(self, used_guitars):
+        """Positions of the top-k distinct new texts by cosine similarity for each used guitar, best first."""
+        queries = [self._count(match_text(used.get('title', ''), used.get('brand'))) for used in used_guitars]
+        with METRICS.stage("ann_search"):
+            sims = (self._vectors(queries) @ self.matrix_t).tocsr()
+        neighbours = []
+        for i in range(len(used_guitars)):
+            start, end = sims.indptr[i], sims.indptr[i + 1]
+            cols, row = sims.indices[start:end], sims.data[start:end]
+            if len(row) > self.k:
+                top = np.argpartition(-row, self.k - 1)[:self.k]
+                cols, row = cols[top], row[top]
+            # Highest similarity first, then catalog order
+            order = np.lexsort((cols, -row))
+            neighbours.append(cols[order].tolist())
+        return neighbours
+
+    def find_best_match(self, used_guitar, threshold=80):
+        """Best (matched guitar, score) for one used guitar, or (None, 0); the brand doesn't have to match."""
+        return self.match_all([used_guitar], threshold)[0]
+
+    def match_all(self, used_guitars, threshold=80, block_size=1024):
+        """
+        One (matched_guitar, score) pair per used guitar, in order.
+        Candidates whose normalized title scores below `threshold` with token_set_ratio are dropped, like in
+        GuitarMatcher; among the rest the highest calculate_match_score wins (ties keep the nearer neighbour).
+        """
+        results = []
+        for start in range(0, len(used_guitars), block_size):
+            block = used_guitars[start:start + block_size]
+            for used, neighbours in zip(block, self.nearest(block)):
+                METRICS.count("candidates_scored", len(neighbours))
+                results.append(self._rerank(used, neighbours, threshold))
+        return results
+
+    def _rerank(self, used_guitar, neighbours, threshold):
+        title = used_guitar.get('title') or ''
+        brand = used_guitar.get('brand')
+        used_title_norm = normalize_title(title, brand)
+        used_brand_words = brand_words(brand)
+        used_price = used_guitar.get('price') or 0
+        fuzzy_scores = {}
+        best = (None, 0)
+        for text_idx in neighbours:
+            for idx in self.variants[text_idx]:
+                if used_brand_words and self.brand_words[idx] and not used_brand_words & self.brand_words[idx]:
+                    continue
+                new_title_norm = self.normalized[idx]
+                fuzzy_score = fuzzy_scores.get(new_title_norm)
+                if fuzzy_score is None:
+                    with METRICS.stage("fuzzy_score"):
+                        fuzzy_score = fuzzy_scores[new_title_norm] = fuzz.token_set_ratio(used_title_norm, new_title_norm)
+                if fuzzy_score < threshold:
+                    continue
+                with METRICS.stage("match_score"):
+                    score = calculate_match_score(
+                        used_title=title,
+                        new_title=self.titles[idx],
+                        used_price=used_price,
+                        new_price=self.prices[idx],
+                        brand=brand,
+                        used_title_norm=used_title_norm,
+                        new_title_norm=new_title_norm
+                    )
+                if best[0] is None or score > best[1]:
+                    best = (self.new_guitars[idx], score)
+        if best[0] is not None:
+            METRICS.count("matches_above_threshold")
+        return best
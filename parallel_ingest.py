@@ -0,0 +1,36 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def resolve_workers(workers):
+    """Translate a --workers value into a process count (-1 = all cores)."""
+    return (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+
+
+def _parse_to_list(parse, file_path):
+    parsed = parse(file_path)
+    return None if parsed is None else list(parsed)
+
+
+class ParallelParser:
+    """
+    Parses dump files in a process pool. Files are queued with submit() and their results are
+    collected with result() in whatever order the caller asks for, so merges stay deterministic.
+    `parse` must be a module-level function (or a functools.partial of one) so it can be pickled.
+    """
+
+    def __init__(self, workers):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    def submit(self, parse, file_path):
+        self.futures[file_path] = self.pool.submit(_parse_to_list, parse, file_path)
+
+    def result(self, file_path):
+        return self.futures.pop(file_path).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown(cancel_futures=True)
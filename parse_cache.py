@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+
+from listing import Listing, json_default
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(*paths):
+    """Hash of the given source files, so cached parse output is dropped whenever the parsing code changes."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Manifest of parsed dump files (size, mtime and content hash) plus each file's cached parse output.
+    Unchanged files are served from the cache; new or changed files are parsed and cached as they are read.
+    Call save() after the combined output has been written to persist the manifest.
+    """
+
+    def __init__(self, cache_dir, fingerprint):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.entries = {}
+        self.seen = set()
+        self.reused = 0
+        self.parsed = 0
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("fingerprint") == fingerprint:
+                self.entries = manifest.get("files", {})
+
+    def _output_path(self, file_name):
+        return os.path.join(self.cache_dir, f"{file_name}.ndjson")
+
+    def _unchanged_entry(self, file_path, stat):
+        """Return the manifest entry for a file if its contents haven't changed since it was cached."""
+        file_name = os.path.basename(file_path)
+        entry = self.entries.get(file_name)
+        if not entry:
+            return None
+        if not entry.get("skipped") and not os.path.exists(self._output_path(file_name)):
+            return None
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry
+        # Size or mtime moved (e.g. the file was copied again); only the content hash decides
+        if entry["size"] == stat.st_size and entry["sha256"] == file_digest(file_path):
+            entry["mtime"] = stat.st_mtime
+            return entry
+        return None
+
+    def is_stale(self, file_path):
+        """True if the file is new or changed, i.e. records() would have to parse it."""
+        return self._unchanged_entry(file_path, os.stat(file_path)) is None
+
+    def _read_output(self, file_name):
+        with open(self._output_path(file_name), 'r', encoding='utf-8') as f:
+            for line in f:
+                yield Listing.from_dict(json.loads(line))
+
+    def _write_through(self, file_path, stat, records):
+        """Yield records while writing them to the file's cache output; the manifest entry is added once all are written."""
+        file_name = os.path.basename(file_path)
+        output_path = self._output_path(file_name)
+        tmp_path = output_path + ".tmp"
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+                count += 1
+                yield record
+        os.replace(tmp_path, output_path)
+        self.entries[file_name] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_digest(file_path),
+            "records": count,
+            "skipped": False
+        }
+
+    def records(self, file_path, parse):
+        """
+        Return an iterable of the parsed records for file_path, or None if the file was skipped.
+        parse(file_path) is only called when the file is new or changed; it returns an iterable or None to skip.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_name = os.path.basename(file_path)
+        self.seen.add(file_name)
+        stat = os.stat(file_path)
+
+        entry = self._unchanged_entry(file_path, stat)
+        if entry:
+            self.reused += 1
+            return None if entry.get("skipped") else self._read_output(file_name)
+
+        self.parsed += 1
+        parsed = parse(file_path)
+        if parsed is None:
+            self.entries[file_name] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": file_digest(file_path),
+                "records": 0,
+                "skipped": True
+            }
+            return None
+        return self._write_through(file_path, stat, parsed)
+
+    def save(self):
+        """Write the manifest, dropping entries and cached outputs for dump files that no longer exist."""
+        for file_name in list(self.entries):
+            if file_name not in self.seen:
+                del self.entries[file_name]
+                if os.path.exists(self._output_path(file_name)):
+                    os.remove(self._output_path(file_name))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": self.fingerprint, "files": self.entries}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
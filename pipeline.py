@@ -0,0 +1,117 @@
+import argparse
+import os
+from contextlib import nullcontext
+
+import catalog_db
+from analysis import GuitarMatcher, add_report_arguments, bucket_by_brand, iter_matches, print_matches, report_options
+from deal_queries import select_top_matches
+from dedup import dedup_listings
+from dump_streaming import JsonArrayWriter
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from new_guitar_parsing import iter_new_guitars, new_guitar_files
+from parallel_ingest import ParallelParser, resolve_workers
+from used_guitar_parsing import iter_used_guitars, used_guitar_jobs
+
+
+def tee_to_json(records, output_path):
+    """Pass records through unchanged while writing them to a combined JSON file as a side output."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as out_file:
+        writer = JsonArrayWriter(out_file)
+        for record in records:
+            writer.write(record)
+            yield record
+        writer.close()
+
+
+def match_stage(used_guitars, matcher, batch_size=1024, **match_kwargs):
+    """Match used guitars in batches as they arrive, yielding (used guitar, (matched new guitar, score)) pairs."""
+    batch = []
+    for used in used_guitars:
+        batch.append(used)
+        if len(batch) >= batch_size:
+            yield from zip(batch, matcher.match_all(batch, **match_kwargs))
+            batch = []
+    if batch:
+        yield from zip(batch, matcher.match_all(batch, **match_kwargs))
+
+
+def run_pipeline(data_folder, stream=False, write_combined=False, parse_workers=1, batch_size=1024,
+                 report=None, sqlite=None, **match_kwargs):
+    """
+    Raw dumps -> parsed listings -> deduplicated listings -> brand buckets -> matches -> ranked report rows, in one process.
+    Listings flow between stages as generators; only the new catalog (needed whole for the brand
+    buckets) and the current batch of used listings are held in memory.
+    With write_combined the parsed listings are also written to data/combined/*_combined.json on the way through.
+    `report` holds select_top_matches options (price windows, min_score, k).
+    With sqlite (a database path) the parsed listings and every match row are also written to that SQLite catalog.
+    """
+    workers = resolve_workers(parse_workers)
+    pool = ParallelParser(workers) if workers > 1 else None
+    output_folder = os.path.join(data_folder, 'combined')
+
+    # Catalog writes are committed once, when the whole run has completed
+    with pool or nullcontext(), catalog_db.transaction(sqlite) if sqlite else nullcontext() as conn:
+        new_guitars = iter_new_guitars(new_guitar_files(data_folder), stream, pool=pool)
+        used_guitars = iter_used_guitars(used_guitar_jobs(data_folder, stream), pool=pool)
+        if write_combined:
+            new_guitars = tee_to_json(new_guitars, os.path.join(output_folder, 'new_guitars_combined.json'))
+            used_guitars = tee_to_json(used_guitars, os.path.join(output_folder, 'used_guitars_combined.json'))
+        if conn:
+            new_guitars = catalog_db.tee_listings(new_guitars, conn, 'new')
+            used_guitars = catalog_db.tee_listings(used_guitars, conn, 'used')
+        # After the tee, so the combined files still hold everything the parsers produced
+        new_guitars = dedup_listings(new_guitars)
+        used_guitars = dedup_listings(used_guitars)
+
+        with METRICS.stage("bucket"):
+            new_guitars_by_brand = bucket_by_brand(new_guitars)
+        matcher = GuitarMatcher(new_guitars_by_brand)
+        matched = match_stage(used_guitars, matcher, batch_size, **match_kwargs)
+        matches = iter_matches(matched)
+        if conn:
+            matches = catalog_db.tee_matches(matches, conn)
+        # Stages nest here: parsing and matching of used listings happen while sort_filter pulls rows through
+        with METRICS.stage("sort_filter"):
+            return select_top_matches(matches, **(report or {}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse the raw dumps and match used guitars against new ones in one run.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream hits one at a time instead of loading each dump with json.load")
+    parser.add_argument("--write-combined", action="store_true",
+                        help="Also write data/combined/*_combined.json as a side output")
+    parser.add_argument("--parse-workers", type=int, default=1,
+                        help="Parse dumps in a pool of this many processes (-1 = all cores, 1 = serial)")
+    parser.add_argument("--workers", type=int, default=-1,
+                        help="Cores used for batch matching (-1 = all cores)")
+    parser.add_argument("--blocking", action="store_true",
+                        help="Only fuzzy-score new guitars that share a title token or model series with the used guitar")
+    parser.add_argument("--batch-size", type=int, default=1024,
+                        help="Used listings matched per batch")
+    parser.add_argument("--sqlite", nargs="?", const=catalog_db.DEFAULT_PATH, metavar="PATH",
+                        help="Also write listings and all match rows into a SQLite catalog (default data/catalog.sqlite)")
+    add_report_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    try:
+        data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        top_matches = run_pipeline(
+            data_folder,
+            stream=args.stream,
+            write_combined=args.write_combined,
+            parse_workers=args.parse_workers,
+            batch_size=args.batch_size,
+            report=report_options(args),
+            sqlite=args.sqlite,
+            workers=args.workers,
+            blocking=args.blocking
+        )
+        print_matches(top_matches)
+        finish_metrics(args)
+
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import time
+import zlib
+
+from dedup import listing_id
+from dump_streaming import iter_hits
+from listing import load_listings, to_cents
+from used_guitar_parsing import used_guitar_jobs
+
+DAY = 86400
+
+# Every KEYFRAME_INTERVAL-th snapshot stores absolute prices, so a query only decodes from the keyframe before its window
+KEYFRAME_INTERVAL = 32
+
+
+def encode_varints(values):
+    """Unsigned LEB128 varints; small numbers (most deltas) take one byte."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data, count=None, pos=0):
+    """Decode `count` varints (all of them if None) from data starting at pos; returns (values, next position)."""
+    values = []
+    value = shift = 0
+    end = len(data)
+    while pos < end and (count is None or len(values) < count):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values, pos
+
+
+def zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+
+def published_dates(data_folder):
+    """Listing ID -> published_at (unix time) from the raw Sweetwater dumps; the parsed records don't keep it."""
+    dates = {}
+    for path, _, _ in used_guitar_jobs(data_folder):
+        if "other" in os.path.basename(path):
+            continue
+        try:
+            hits = iter_hits(path, ("slug", "published_at"), allow_list=False)
+        except ValueError:
+            continue
+        for hit in hits:
+            if hit.get("slug") and hit.get("published_at"):
+                dates[hit["slug"]] = hit["published_at"]
+    return dates
+
+
+class PriceHistory:
+    """
+    Append-only price history of every listing, one snapshot per recorded run.
+
+    history_dir/listings.ndjson  one line per listing ever seen (ID, kind, brand, title, URL, first snapshot,
+                                 published_at); a listing's line number is its number in the columns below
+    history_dir/snapshots.idx    per snapshot, varints: taken_at delta from the previous snapshot, block length,
+                                 listing count, keyframe flag
+    history_dir/snapshots.bin    per snapshot, one zlib block of two columns: the sorted listing numbers present
+                                 (delta-encoded) and their prices in cents (zigzag delta from the listing's previous
+                                 price since the last keyframe; from 0 in a keyframe)
+
+    Unchanged prices encode as a single zero byte before compression, so daily snapshots of a mostly stable
+    catalog cost a few bytes per listing.
+    """
+
+    def __init__(self, history_dir):
+        self.history_dir = history_dir
+        self.listings_path = os.path.join(history_dir, "listings.ndjson")
+        self.index_path = os.path.join(history_dir, "snapshots.idx")
+        self.blocks_path = os.path.join(history_dir, "snapshots.bin")
+
+        self.listings = []
+        self.numbers = {}
+        if os.path.exists(self.listings_path):
+            with open(self.listings_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    listing = json.loads(line)
+                    self.numbers[listing["id"]] = len(self.listings)
+                    self.listings.append(listing)
+
+        # Per snapshot: (taken_at, offset, length, count, keyframe)
+        self.snapshots = []
+        # Bytes of the index and blocks files that belong to complete snapshots; anything after them was left by an
+        # interrupted record() and is cut off before the next one is appended
+        self.index_size = self.blocks_size = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            fields, _ = decode_varints(data)
+            fields = fields[:len(fields) - len(fields) % 4]
+            _, self.index_size = decode_varints(data, len(fields))
+            taken_at = 0
+            for i in range(0, len(fields), 4):
+                delta, length, count, keyframe = fields[i:i + 4]
+                taken_at += delta
+                self.snapshots.append((taken_at, self.blocks_size, length, count, bool(keyframe)))
+                self.blocks_size += length
+
+    def _read_block(self, f, snapshot):
+        _, offset, length, count, _ = snapshot
+        f.seek(offset)
+        data = zlib.decompress(f.read(length))
+        gaps, pos = decode_varints(data, count)
+        deltas, _ = decode_varints(data, count, pos)
+        numbers = []
+        number = 0
+        for gap in gaps:
+            number += gap
+            numbers.append(number)
+        return numbers, [unzigzag(d) for d in deltas]
+
+    def iter_snapshots(self, since=None):
+        """
+        Yield (taken_at, {listing number: price in cents}) for each snapshot taken at or after `since`,
+        plus the last one before it (so callers know prices at the window start).
+        Only blocks from the keyframe preceding that snapshot onwards are read.
+        """
+        first = 0
+        if since is not None:
+            while first + 1 < len(self.snapshots) and self.snapshots[first + 1][0] <= since:
+                first += 1
+        start = first
+        while start > 0 and not self.snapshots[start][4]:
+            start -= 1
+        if not self.snapshots:
+            return
+
+        state = {}
+        with open(self.blocks_path, "rb") as f:
+            for i in range(start, len(self.snapshots)):
+                snapshot = self.snapshots[i]
+                if snapshot[4]:
+                    state = {}
+                numbers, deltas = self._read_block(f, snapshot)
+                prices = {}
+                for number, delta in zip(numbers, deltas):
+                    prices[number] = state.get(number, 0) + delta
+                state.update(prices)
+                if i >= first:
+                    yield snapshot[0], prices
+
+    def _current_state(self):
+        """Last known price per listing since the most recent keyframe (what the next delta block is encoded against)."""
+        state = {}
+        start = len(self.snapshots) - 1
+        while start > 0 and not self.snapshots[start][4]:
+            start -= 1
+        for _, prices in self.iter_snapshots(self.snapshots[start][0]):
+            state.update(prices)
+        return state
+
+    def record(self, catalogs, taken_at=None, published=None):
+        """
+        Append one snapshot of current prices from `catalogs` ({'used': guitars, 'new': guitars}).
+        Listings without a slug or URL are skipped and repeated IDs keep their first price.
+        `published` maps listing IDs to published_at. Returns the number of listings recorded.
+        """
+        taken_at = int(taken_at if taken_at is not None else time.time())
+        if self.snapshots and taken_at <= self.snapshots[-1][0]:
+            raise ValueError(f"snapshot at {taken_at} is not newer than the last one ({self.snapshots[-1][0]})")
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        prices = {}
+        new_listings = []
+        for kind, guitars in catalogs.items():
+            for guitar in guitars:
+                key = listing_id(guitar)
+                if not key:
+                    continue
+                number = self.numbers.get(key)
+                if number is None:
+                    number = self.numbers[key] = len(self.listings)
+                    listing = {
+                        "id": key,
+                        "kind": kind,
+                        "brand": guitar.get("brand"),
+                        "title": guitar.get("title"),
+                        "url": guitar.get("url"),
+                        "first_snapshot": len(self.snapshots),
+                        "published_at": (published or {}).get(key)
+                    }
+                    self.listings.append(listing)
+                    new_listings.append(listing)
+                if number not in prices:
+                    prices[number] = to_cents(guitar.get("price"))
+
+        keyframe = len(self.snapshots) % KEYFRAME_INTERVAL == 0
+        state = {} if keyframe else self._current_state()
+        numbers = sorted(prices)
+        gaps = [number - previous for previous, number in zip([0] + numbers, numbers)]
+        deltas = [zigzag(prices[number] - state.get(number, 0)) for number in numbers]
+        block = zlib.compress(encode_varints(gaps) + encode_varints(deltas), 9)
+
+        previous = self.snapshots[-1][0] if self.snapshots else 0
+        entry = encode_varints([taken_at - previous, len(block), len(numbers), int(keyframe)])
+        with open(self.listings_path, "a", encoding="utf-8") as f:
+            for listing in new_listings:
+                f.write(json.dumps(listing, ensure_ascii=False) + "\n")
+        # Offsets are rebuilt from the indexed block lengths, so the block must start right after the last indexed one
+        with open(self.blocks_path, "ab") as f:
+            f.truncate(self.blocks_size)
+            f.write(block)
+        # The index is written last: a snapshot only exists once its index entry does
+        with open(self.index_path, "ab") as f:
+            f.truncate(self.index_size)
+            f.write(entry)
+        self.snapshots.append((taken_at, self.blocks_size, len(block), len(numbers), keyframe))
+        self.index_size += len(entry)
+        self.blocks_size += len(block)
+        return len(numbers)
+
+    def listing_history(self, key):
+        """[(taken_at, price)] for one listing across every snapshot it appears in."""
+        number = self.numbers.get(key)
+        if number is None:
+            return []
+        return [(taken_at, prices[number] / 100) for taken_at, prices in self.iter_snapshots() if number in prices]
+
+    def listed_since(self, number):
+        """When a listing went up: its published_at if the dump had one, else the snapshot it was first seen in."""
+        listing = self.listings[number]
+        return listing.get("published_at") or self.snapshots[listing["first_snapshot"]][0]
+
+    def price_drops(self, days=7, now=None):
+        """
+        Listings still in the latest snapshot whose price fell over the last `days`, as dicts with the price at the
+        window start (or when first seen inside it), the current price and the drop, largest drop first.
+        """
+        if not self.snapshots:
+            return []
+        now = now if now is not None else self.snapshots[-1][0]
+        since = now - days * DAY
+        start_prices = {}
+        latest = {}
+        for taken_at, prices in self.iter_snapshots(since):
+            for number, price in prices.items():
+                start_prices.setdefault(number, price)
+            latest = prices
+
+        drops = []
+        for number, price in latest.items():
+            drop = start_prices[number] - price
+            if drop > 0:
+                listing = self.listings[number]
+                drops.append({
+                    "id": listing["id"],
+                    "kind": listing["kind"],
+                    "brand": listing["brand"],
+                    "title": listing["title"],
+                    "url": listing["url"],
+                    "was": start_prices[number] / 100,
+                    "price": price / 100,
+                    "drop": drop / 100,
+                    "days_listed": (now - self.listed_since(number)) / DAY
+                })
+        drops.sort(key=lambda row: row["drop"], reverse=True)
+        return drops
+
+
+def biggest_drop_per_brand(drops):
+    """The largest drop for each brand, largest first."""
+    best = {}
+    for row in drops:
+        if row["brand"] not in best:
+            best[row["brand"]] = row
+    return list(best.values())
+
+
+if __name__ == "__main__":
+    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    parser = argparse.ArgumentParser(description="Record and query the price history of used and new listings.")
+    parser.add_argument("--history-dir", default=os.path.join(data_folder, "price_history"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="Append a snapshot of the combined files' current prices")
+    record.add_argument("--taken-at", type=int, help="Snapshot time as unix seconds (default: now)")
+    drops = commands.add_parser("drops", help="Largest price drops over the last few days")
+    drops.add_argument("--days", type=float, default=7)
+    drops.add_argument("--per-brand", action="store_true", help="Only the largest drop for each brand")
+    drops.add_argument("--brand", help="Only this brand")
+    drops.add_argument("--top", type=int, default=20)
+    history = commands.add_parser("history", help="Price history of one listing")
+    history.add_argument("listing_id", help="Listing slug (or URL for listings without one)")
+    commands.add_parser("stats", help="Snapshot count and size on disk")
+    args = parser.parse_args()
+
+    try:
+        store = PriceHistory(args.history_dir)
+
+        if args.command == "record":
+            catalogs = {
+                "used": load_listings(os.path.join(data_folder, 'combined', 'used_guitars_combined.json')),
+                "new": load_listings(os.path.join(data_folder, 'combined', 'new_guitars_combined.json'))
+            }
+            count = store.record(catalogs, args.taken_at, published_dates(data_folder))
+            print(f"✅ Recorded {count} listing prices in snapshot {len(store.snapshots)}")
+
+        elif args.command == "drops":
+            rows = store.price_drops(args.days)
+            if args.brand:
+                rows = [row for row in rows if row["brand"] == args.brand]
+            if args.per_brand:
+                rows = biggest_drop_per_brand(rows)
+            print(f"Largest price drops in the last {args.days:g} days:\n")
+            for idx, row in enumerate(rows[:args.top], 1):
+                print(f"{idx}. {row['title']} - {row['brand']} ({row['kind']})")
+                print(f"   ${row['was']:.2f} -> ${row['price']:.2f} (-${row['drop']:.2f}), listed {row['days_listed']:.0f} days")
+                print(f"   URL: {row['url']}")
+                print()
+
+        elif args.command == "history":
+            for taken_at, price in store.listing_history(args.listing_id):
+                print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(taken_at))}  ${price:.2f}")
+
+        elif args.command == "stats":
+            size = sum(os.path.getsize(p) for p in (store.listings_path, store.index_path, store.blocks_path)
+                       if os.path.exists(p))
+            print(f"{len(store.snapshots)} snapshots of {len(store.listings)} listings, {size} bytes on disk")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import random
+
+# Brand -> (model names, series) used to build realistic titles
+CATALOG = {
+    "Fender": (["Stratocaster", "Telecaster", "Jazzmaster", "Jaguar", "Mustang", "Precision Bass", "Jazz Bass"],
+               ["Player", "Player II", "American Professional II", "American Ultra", "American Performer",
+                "Vintera II '60s", "American Vintage II", "Custom Shop", "75th Anniversary"]),
+    "Gibson": (["Les Paul Standard '50s", "Les Paul Studio", "Les Paul Tribute", "SG Standard", "SG Special",
+                "Flying V", "Explorer", "ES-335", "Firebird"],
+               ["", "Custom Shop", "Artist Series", "Slash", "Commemorative"]),
+    "PRS": (["Custom 24", "Custom 24-08", "McCarty 594", "Silver Sky", "CE 24", "S2 Vela", "Paul's Guitar"],
+            ["SE", "S2", "Core", "Private Stock"]),
+    "Ibanez": (["RG550", "RG470", "JEM7V", "S520", "AZ2402", "Prestige RG5320"],
+               ["Standard", "Prestige", "Premium", "Genesis Collection"]),
+    "Jackson": (["Soloist SL2", "Dinky", "Rhoads RR24", "Kelly KE2"],
+                ["Pro Series", "X Series", "USA Select", "JS Series"]),
+    "Charvel": (["Pro-Mod San Dimas", "Pro-Mod DK24", "Guthrie Govan Signature"],
+                ["Pro-Mod", "USA Select", "Custom Shop"]),
+    "Schecter": (["Hellraiser C-1", "Reaper-6", "Blackjack SLS C-1", "Sun Valley Super Shredder"],
+                 ["", "Diamond Series", "USA Custom Shop"]),
+    "EVH": (["Wolfgang Standard", "Wolfgang Special", "5150 Series Standard"],
+            ["", "USA", "Striped Series"]),
+    "Squier": (["Stratocaster", "Telecaster", "Jazzmaster"],
+               ["Classic Vibe '60s", "Affinity Series", "Contemporary", "Paranormal"]),
+    "Epiphone": (["Les Paul Standard '60s", "SG Standard", "Casino", "Explorer"],
+                 ["", "Inspired by Gibson", "Inspired by Gibson Custom"]),
+}
+FINISHES = ["Black", "Olympic White", "3-Color Sunburst", "Candy Apple Red", "Sea Foam Green", "Natural",
+            "Cherry Burst", "Tobacco Burst", "Lake Placid Blue", "Charcoal Burst", "Faded Pelham Blue",
+            "Silver Metallic", "Translucent Blue", "Vintage Sunburst", "Wine Red", "Pearl White"]
+NECKS = ["Maple Fingerboard", "Rosewood Fingerboard", "Ebony Fingerboard", "Pau Ferro Fingerboard", ""]
+PICKUPS = ["HSS", "SSS", "HH", "P90", ""]
+CONDITIONS = ["Mint", "Excellent", "Very Good", "Good", "Fair"]
+LOCATIONS = ["Fort Wayne, IN", "Iselin, NJ", "Nashville, TN", "Austin, TX", "Portland, OR", "Thousand Oaks, CA",
+             "Chicago, IL", "Brooklyn, NY"]
+HITS_PER_PAGE = 60
+
+
+def _model(rng):
+    brand = rng.choice(list(CATALOG))
+    models, series = CATALOG[brand]
+    parts = [rng.choice(series), rng.choice(models), rng.choice(PICKUPS), rng.choice(NECKS)]
+    return brand, " ".join(part for part in parts if part)
+
+
+def _highlight(text):
+    return {"value": text, "matchLevel": "none", "matchedWords": []}
+
+
+def used_hit(rng, object_id):
+    """One hit in the used (Sweetwater) dump format."""
+    brand, model = _model(rng)
+    title = f"{model} Electric Guitar - {rng.choice(FINISHES)}"
+    original_price = rng.randrange(300, 6000)
+    price = original_price - rng.choice([0, 0, 0, rng.randrange(10, 300)])
+    free_shipping = rng.random() < 0.8
+    slug = f"{object_id}-used-{brand}-{title}".lower().replace(" ", "-").replace("'", "")
+    image = f"https://media.sweetwater.com/m/gx/{rng.getrandbits(160):040x}.jpg?quality=75&auto=webp"
+    return {
+        "item_id": None,
+        "slug": slug,
+        "title": title,
+        "price": price,
+        "price_drop": original_price - price,
+        "brand": brand,
+        "original_price": original_price,
+        "free_shipping": int(free_shipping),
+        "shipping_message": "Free Shipping" if free_shipping else f"${rng.randrange(20, 120)}.00 Shipping",
+        "sale_percentage": None,
+        "shipping": {
+            "shipping_available": 1,
+            "local_pickup_available": int(rng.random() < 0.3)
+        },
+        "condition": rng.choice(CONDITIONS),
+        "customer_since": str(rng.randrange(2005, 2025)),
+        "primary_image": {
+            "alt_text": f"Used {brand} guitar. Listed by a GX seller for ${price}.00.",
+            "url": image + "&width=850",
+            "medium_url": image + "&width=350&fit=bounds",
+            "thumbnail_url": image + "&width=185&fit=bounds"
+        },
+        "accepts_offers": int(rng.random() < 0.5),
+        "made_decade": rng.choice(["1990s", "2000s", "2010s", "2020s"]),
+        "published_at": 1749834622 - rng.randrange(0, 90 * 86400),
+        "location": rng.choice(LOCATIONS),
+        "objectID": str(object_id),
+        "_highlightResult": {
+            "title": _highlight(title),
+            "brand": _highlight(brand),
+            "condition": _highlight("Used"),
+            "category": {"name": _highlight("Solidbody Guitars")}
+        }
+    }
+
+
+def new_hit(rng, sku_number):
+    """One hit in the new (Guitar Center) dump format, with its bulky colour-variant SKU properties."""
+    brand, model = _model(rng)
+    finishes = rng.sample(FINISHES, rng.randrange(1, 5))
+    display_name = f"{brand} {model} Electric Guitar {finishes[0]}"
+    list_price = round(rng.randrange(300, 7000) - 0.01, 2)
+    price = list_price if rng.random() < 0.7 else round(list_price * rng.uniform(0.75, 0.95), 2)
+    sku = f"site5{sku_number:014d}"
+    seo_url = f"/{brand}/{display_name[len(brand) + 1:].replace(' ', '-').replace(chr(39), '')}-{sku[5:]}.gc"
+    return {
+        "displayName": display_name,
+        "review": {"totalReviews": rng.randrange(0, 200), "overallRating": round(rng.uniform(0, 5), 1)},
+        "price": price,
+        "skuId": sku,
+        "condition": {"lvl0": "New"},
+        "imageId": f"M{rng.randrange(10 ** 14):014d}",
+        "listPrice": list_price,
+        "seoUrl": seo_url,
+        "_highlightResult": {
+            "brand": _highlight(brand),
+            "allSkuProperties": [{"displayName": _highlight(f"{brand} {model} Electric Guitar {finish}")}
+                                 for finish in finishes],
+            "Color": [_highlight(finish) for finish in finishes]
+        },
+        "productId": f"{rng.randrange(10 ** 12)}",
+        "identifiers": [sku, f"{rng.randrange(10 ** 12):012d}"],
+        "retailOnly": rng.random() < 0.05,
+        "priceVisibility": 1,
+        "brand": brand,
+        "allSkuProperties": [{"displayName": f"{brand} {model} Electric Guitar {finish}", "color": finish}
+                             for finish in finishes],
+        "objectID": sku
+    }
+
+
+def _page(hits, page):
+    return {
+        "hits": hits,
+        "nbHits": len(hits),
+        "page": page,
+        "hitsPerPage": len(hits),
+        "exhaustiveNbHits": True,
+        "query": "",
+        "params": f"page={page}&hitsPerPage={len(hits)}",
+        "processingTimeMS": 1
+    }
+
+
+def write_dumps(data_folder, prefix, make_hit, count, seed=0, pages_per_file=20, hits_per_page=HITS_PER_PAGE):
+    """Write `count` synthetic hits as numbered Algolia dumps <prefix>1.json, <prefix>2.json, ... and return their paths."""
+    os.makedirs(data_folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    written = 0
+    while written < count:
+        results = []
+        for page in range(pages_per_file):
+            size = min(hits_per_page, count - written)
+            if size <= 0:
+                break
+            results.append(_page([make_hit(rng, written + i + 1) for i in range(size)], page))
+            written += size
+        path = os.path.join(data_folder, f"{prefix}{len(paths) + 1}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=4)
+        paths.append(path)
+    return paths
+
+
+def generate_catalog(data_folder, used_count, new_count, seed=0):
+    """Write synthetic used_guitars*.json and new_guitars*.json dumps into data_folder."""
+    used = write_dumps(data_folder, "used_guitars", used_hit, used_count, seed)
+    new = write_dumps(data_folder, "new_guitars", new_hit, new_count, seed + 1)
+    return used, new
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic Algolia-shaped used and new guitar dumps.")
+    parser.add_argument("data_folder", help="Folder to write the dumps into")
+    parser.add_argument("--used", type=int, default=1000, help="Number of used (Sweetwater) hits")
+    parser.add_argument("--new", type=int, default=1000, help="Number of new (Guitar Center) hits")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    used_paths, new_paths = generate_catalog(args.data_folder, args.used, args.new, args.seed)
+    print(f"✅ Wrote {args.used} used hits in {len(used_paths)} files and {args.new} new hits in {len(new_paths)} files")
@@ -0,0 +1,44 @@
+import asyncio
+
+from algolia_fetcher import dump_path, fetch_dumps, read_dump, write_dump
+
+
+class StubFetcher:
+    """Serves one generation of an index: `pages` pages whose single hit names the generation and page."""
+
+    def __init__(self, generation, pages):
+        self.generation = generation
+        self.pages = pages
+        self.fetched = []
+
+    async def fetch_page(self, page):
+        self.fetched.append(page)
+        return {"results": [{"hits": [{"objectID": f"{self.generation}-{page}"}], "nbPages": self.pages}]}
+
+    async def iter_pages(self, pages):
+        for page in pages:
+            yield page, await self.fetch_page(page)
+
+
+def hits(data_folder, page):
+    return [hit["objectID"] for hit in read_dump(dump_path(data_folder, "dump", page))["results"][0]["hits"]]
+
+
+def test_refetch_replaces_existing_dumps(tmp_path):
+    asyncio.run(fetch_dumps(StubFetcher(1, 2), tmp_path, "dump"))
+
+    written, skipped = asyncio.run(fetch_dumps(StubFetcher(2, 3), tmp_path, "dump", resume=False))
+
+    assert (written, skipped) == (3, 0)
+    assert [hits(tmp_path, page) for page in range(3)] == [["2-0"], ["2-1"], ["2-2"]]
+
+
+def test_resume_reuses_the_first_dump(tmp_path):
+    write_dump(dump_path(tmp_path, "dump", 0), asyncio.run(StubFetcher(1, 2).fetch_page(0)))
+    fetcher = StubFetcher(2, 3)
+
+    written, skipped = asyncio.run(fetch_dumps(fetcher, tmp_path, "dump"))
+
+    assert (written, skipped) == (1, 1)
+    assert fetcher.fetched == [1]
+    assert hits(tmp_path, 0) == ["1-0"]
@@ -0,0 +1,18 @@
+from analysis import GuitarMatcher, bucket_by_brand, find_best_match
+
+
+def test_colour_variants_keep_the_first_listing():
+    # Both normalize to the same title; the cheaper second variant would score higher against a $300 used guitar
+    new_guitars = [
+        {"title": "Fender Player Stratocaster Black", "brand": "Fender", "price": 1500},
+        {"title": "Fender Player Stratocaster Sunburst", "brand": "Fender", "price": 800},
+    ]
+    used = {"title": "Fender Player Stratocaster Electric Guitar", "brand": "Fender", "price": 300}
+    new_guitars_by_brand = bucket_by_brand(new_guitars)
+    matcher = GuitarMatcher(new_guitars_by_brand)
+
+    expected = find_best_match(used, new_guitars_by_brand)
+    assert expected[0] is new_guitars[0]
+    assert matcher.find_best_match(used) == expected
+    assert matcher.find_best_match(used, blocking=True) == expected
+    assert matcher.match_all([used], workers=1) == [expected]
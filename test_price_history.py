@@ -0,0 +1,25 @@
+from price_history import PriceHistory
+
+
+def catalog(price):
+    return {"used": [{"slug": "fender-strat", "brand": "Fender", "title": "Stratocaster", "url": None, "price": price}]}
+
+
+def test_round_trip_after_interrupted_record(tmp_path):
+    store = PriceHistory(tmp_path)
+    store.record(catalog(100), taken_at=1)
+    store.record(catalog(90), taken_at=2)
+
+    # A record() interrupted between writing its block and its index entry, plus a torn index entry
+    with open(store.blocks_path, "ab") as f:
+        f.write(b"orphan block")
+    with open(store.index_path, "ab") as f:
+        f.write(b"\x01\x85")
+
+    store = PriceHistory(tmp_path)
+    assert [taken_at for taken_at, *_ in store.snapshots] == [1, 2]
+    store.record(catalog(80), taken_at=3)
+    store.record(catalog(85), taken_at=4)
+
+    for reloaded in (store, PriceHistory(tmp_path)):
+        assert reloaded.listing_history("fender-strat") == [(1, 100.0), (2, 90.0), (3, 80.0), (4, 85.0)]
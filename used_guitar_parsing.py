@@ -1,7 +1,20 @@
+import argparse
 import json
 import os
 import re
-from new_guitar_parsing import parse_new_guitars
+from contextlib import nullcontext
+from functools import partial
+import catalog_db
+import columnar
+import dump_streaming
+import listing
+import new_guitar_parsing
+from dump_streaming import NotADumpError, iter_hits, write_json_array
+from listing import Listing, json_default
+from metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from new_guitar_parsing import read_new_guitar_file
+from parallel_ingest import ParallelParser, resolve_workers
+from parse_cache import ParseCache, source_fingerprint
 
 BASE_SITE_URL = "https://www.guitarcenter.com"
 
@@ -12,93 +25,180 @@ def load_json_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
+# Hit keys read by parse_used_guitar_hit; everything else in a dump is skipped when streaming
+USED_HIT_FIELDS = ("title", "brand", "price", "original_price", "price_drop", "condition", "location", "slug", "shipping")
+
+def parse_used_guitar_hit(item):
+    shipping_info = item.get("shipping", {})
+    slug = item.get("slug")
+    free_shipping = shipping_info.get("free_shipping", 1)  # Default to free shipping if not specified
+    shipping_message = shipping_info.get("shipping_message", "")
+    shipping_price = 0
+
+    # Check if shipping is free or if there's a shipping cost mentioned
+    if free_shipping == 0 and shipping_message:
+        # Extract shipping cost from the message, e.g., "$40.00 Shipping"
+        match = re.search(r"(\$\d+(\.\d{1,2})?)", shipping_message)
+        if match:
+            shipping_price = float(match.group(1).replace('$', '').replace(',', ''))
+
+    # If the guitar is not from Sweetwater (Guitar Center or other), apply a flat $30 shipping fee
+    if not slug:  # Assuming slug is used for Sweetwater
+        shipping_price = 30  # Flat $30 shipping for other stores
+
+    return Listing(
+        title=item.get("title"),
+        brand=item.get("brand"),
+        price=item.get("price"),
+        original_price=item.get("original_price"),
+        price_drop=item.get("price_drop"),
+        condition=item.get("condition"),
+        location=item.get("location"),
+        slug=slug,
+        url=f"https://www.guitarcenter.com/{slug}" if slug else None,  # ✅ Add this
+        shipping_available=bool(shipping_info.get("shipping_available")),
+        local_pickup_available=bool(shipping_info.get("local_pickup_available")),
+        store="Sweetwater" if slug else "Guitar Center",  # Use Guitar Center for other stores
+        shipping_price=shipping_price  # Add shipping price info
+    )
+
 def parse_used_guitars_old(data):
     guitars = []
     
     for result in data.get("results", []):
         for item in result.get("hits", []):
-            shipping_info = item.get("shipping", {})
-            slug = item.get("slug")
-            free_shipping = shipping_info.get("free_shipping", 1)  # Default to free shipping if not specified
-            shipping_message = shipping_info.get("shipping_message", "")
-            shipping_price = 0
-
-            # Check if shipping is free or if there's a shipping cost mentioned
-            if free_shipping == 0 and shipping_message:
-                # Extract shipping cost from the message, e.g., "$40.00 Shipping"
-                match = re.search(r"(\$\d+(\.\d{1,2})?)", shipping_message)
-                if match:
-                    shipping_price = float(match.group(1).replace('$', '').replace(',', ''))
-
-            # If the guitar is not from Sweetwater (Guitar Center or other), apply a flat $30 shipping fee
-            if not slug:  # Assuming slug is used for Sweetwater
-                shipping_price = 30  # Flat $30 shipping for other stores
-
-            guitar_info = {
-                "title": item.get("title"),
-                "brand": item.get("brand"),
-                "price": item.get("price"),
-                "original_price": item.get("original_price"),
-                "price_drop": item.get("price_drop"),
-                "condition": item.get("condition"),
-                "location": item.get("location"),
-                "slug": slug,
-                "url": f"https://www.guitarcenter.com/{slug}" if slug else None,  # ✅ Add this
-                "shipping_available": bool(shipping_info.get("shipping_available")),
-                "local_pickup_available": bool(shipping_info.get("local_pickup_available")),
-                "store": "Sweetwater" if slug else "Guitar Center",  # Use Guitar Center for other stores
-                "shipping_price": shipping_price  # Add shipping price info
-            }
-            guitars.append(guitar_info)
+            guitars.append(parse_used_guitar_hit(item))
     
     return guitars
 
+def stream_used_guitars_old(file_path):
+    """Return an iterator of parsed used guitars from an old-format dump, read one hit at a time without loading the whole file."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} not found.")
+    return (parse_used_guitar_hit(item) for item in iter_hits(file_path, USED_HIT_FIELDS, allow_list=False))
+
+def read_used_guitar_file_old(file_path, stream=False):
+    """Parse an old-format used dump; returns None if the file doesn't look like that format."""
+    if stream:
+        try:
+            return METRICS.timed("parse", stream_used_guitars_old(file_path))
+        except NotADumpError:
+            return None
+    with METRICS.stage("load"):
+        data = load_json_file(file_path)
+    if isinstance(data, dict) and "results" in data and isinstance(data["results"], list):
+        with METRICS.stage("parse"):
+            return parse_used_guitars_old(data)
+    return None
+
+def used_guitar_jobs(data_folder, stream=False):
+    """
+    The used guitar dumps to combine, in order, as (file path, parser, message if the file is skipped):
+    the traditional Sweetwater dumps first, then the Guitar Center ("other") dumps in the new-guitar format.
+    """
+    # Traditional used guitar files, excluding "other" and "combined"
+    old_files = sorted(
+        f for f in os.listdir(data_folder) 
+        if f.startswith("used_guitars") 
+        and f.endswith(".json") 
+        and "other" not in f 
+        and "combined" not in f
+    )
+
+    # ✅ Define new-format used guitar files
+    new_format_files = sorted(f for f in os.listdir(data_folder) if f.startswith("used_guitars_other") and f.endswith(".json"))
+
+    return [
+        (os.path.join(data_folder, file_name), partial(read_used_guitar_file_old, stream=stream),
+         f"⚠️ Skipping {file_name}, doesn't look like old used_guitar format.")
+        for file_name in old_files
+    ] + [
+        (os.path.join(data_folder, file_name), partial(read_new_guitar_file, stream=stream),
+         f"⚠️ Skipping {file_name}, unexpected format.")
+        for file_name in new_format_files
+    ]
+
+def parse_cache(data_folder):
+    """The incremental-parse cache for used guitar dumps, invalidated whenever the parsing code changes."""
+    return ParseCache(os.path.join(data_folder, '.parse_cache', 'used'),
+                      source_fingerprint(__file__, new_guitar_parsing.__file__, listing.__file__,
+                                         dump_streaming.__file__))
+
+def iter_used_guitars(jobs, cache=None, pool=None):
+    """
+    Yield parsed used guitars from the jobs returned by used_guitar_jobs, in order.
+    With a ParseCache only new or changed dumps are parsed; with a ParallelParser they are parsed in worker processes.
+    """
+    if pool:
+        # Queue every dump that actually needs parsing; results are still merged in job order
+        for file_path, read_file, _ in jobs:
+            if not cache or cache.is_stale(file_path):
+                pool.submit(read_file, file_path)
+
+    for file_path, read_file, skip_message in jobs:
+        reader = pool.result if pool and file_path in pool.futures else read_file
+        parsed = cache.records(file_path, reader) if cache else reader(file_path)
+        if parsed is None:
+            METRICS.count("files_skipped")
+            print(skip_message)
+        else:
+            yield from METRICS.counted("hits_seen", parsed)
+
 if __name__ == "__main__":
-    try:
-        combined_guitars = []
+    parser = argparse.ArgumentParser(description="Parse and combine used guitar dumps.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream hits one at a time instead of loading each dump with json.load")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-parse dumps that are new or changed since the last run, reusing cached output for the rest")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parse dumps in a pool of this many processes (-1 = all cores, 1 = serial)")
+    parser.add_argument("--sqlite", nargs="?", const=catalog_db.DEFAULT_PATH, metavar="PATH",
+                        help="Also write the parsed listings into a SQLite catalog (default data/catalog.sqlite)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Also write a memory-mappable binary catalog, used_guitars_combined.cols")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
 
+    try:
         # Get absolute path of 'data' folder to avoid path issues
         data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
-        # Traditional used guitar files, excluding "other" and "combined"
-        old_files = sorted(
-            f for f in os.listdir(data_folder) 
-            if f.startswith("used_guitars") 
-            and f.endswith(".json") 
-            and "other" not in f 
-            and "combined" not in f
-        )
-
-        for file_name in old_files:
-            file_path = os.path.join(data_folder, file_name)  # Get full file path
-            data = load_json_file(file_path)
-            if isinstance(data, dict) and "results" in data and isinstance(data["results"], list):
-                parsed = parse_used_guitars_old(data)
-                combined_guitars.extend(parsed)
-            else:
-                print(f"⚠️ Skipping {file_name}, doesn't look like old used_guitar format.")
-        
-        # ✅ Define new-format used guitar files
-        new_format_files = sorted(f for f in os.listdir(data_folder) if f.startswith("used_guitars_other") and f.endswith(".json"))
-
-        for file_name in new_format_files:
-            file_path = os.path.join(data_folder, file_name)  # Get full file path
-            data = load_json_file(file_path)
-            parsed = parse_new_guitars(data)  # returns a list
-            if isinstance(parsed, list):
-                combined_guitars.extend(parsed)
-            else:
-                print(f"⚠️ Skipping {file_name}, unexpected format: {type(parsed)}")
+        cache = None
+        if args.incremental:
+            cache = parse_cache(data_folder)
+
+        workers = resolve_workers(args.workers)
+        pool = ParallelParser(workers) if workers > 1 else None
+
+        guitars = iter_used_guitars(used_guitar_jobs(data_folder, args.stream), cache, pool)
         
         # Save all combined data to the correct location
         output_folder = os.path.join(data_folder, 'combined')
         os.makedirs(output_folder, exist_ok=True)
         output_path = os.path.join(output_folder, 'used_guitars_combined.json')
         
-        with open(output_path, "w", encoding="utf-8") as out_file:
-            json.dump(combined_guitars, out_file, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Parsed and combined {len(combined_guitars)} used guitars into used_guitars_combined.json")
+        with pool or nullcontext(), catalog_db.transaction(args.sqlite) if args.sqlite else nullcontext() as conn, \
+                open(output_path + ".tmp", "w", encoding="utf-8") as out_file:
+            if conn:
+                guitars = catalog_db.tee_listings(guitars, conn, 'used')
+            if args.columnar:
+                guitars = columnar.tee_columnar(guitars, columnar.columnar_path(output_path))
+            if args.stream:
+                count = write_json_array(guitars, out_file)
+            else:
+                combined_guitars = list(guitars)
+                json.dump(combined_guitars, out_file, indent=2, ensure_ascii=False, default=json_default)
+                count = len(combined_guitars)
+        # Written beside the combined file and moved over it once complete, so a failed parse keeps the last good one
+        os.replace(output_path + ".tmp", output_path)
+
+        if cache:
+            cache.save()
+            print(f"♻️ Reused {cache.reused} cached dump(s), parsed {cache.parsed} new or changed dump(s)")
+
+        print(f"✅ Parsed and combined {count} used guitars into used_guitars_combined.json")
+        finish_metrics(args)
     
     except Exception as e:
         print(f"❌ Error: {e}")
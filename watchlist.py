@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import time
+from bisect import bisect_left
+
+from analysis import MODEL_SERIES, GuitarMatcher, bucket_by_brand, series_mask
+from catalog_db import real_discount
+from deal_queries import in_window, price_of
+from dedup import dedup_catalogs, listing_id
+from listing import json_default, load_listings, to_cents
+from metrics import METRICS
+
+KINDS = ("used", "new")
+
+
+def series_bits(terms):
+    """Bitmask of MODEL_SERIES terms, matching series_mask (a term listed twice has both of its bits set)."""
+    unknown = [term for term in terms if term not in MODEL_SERIES]
+    if unknown:
+        raise ValueError(f"Not MODEL_SERIES terms: {', '.join(unknown)}")
+    return sum(1 << bit for bit, term in enumerate(MODEL_SERIES) if term in terms)
+
+
+def _key(value):
+    return value.casefold() if value else None
+
+
+def make_watch(watch_id, name=None, kind="used", brand=None, series=(), condition=None, price=None, discount=None,
+               min_score=None):
+    """
+    A saved search, stored as a plain dict. Every criterion left out matches anything:
+    brand and condition compare case-insensitively, every series term must occur in the title (as in
+    calculate_match_score's model bonus), price and discount are (low, high) windows with strict bounds like the
+    reports (either bound may be None), and min_score asks for a match against the new catalog scoring above it.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    if min_score is not None and kind != "used":
+        raise ValueError("min_score only applies to used listings, which are matched against the new catalog")
+    series_bits(series)
+    return {
+        "id": watch_id,
+        "name": name or f"watch {watch_id}",
+        "kind": kind,
+        "brand": brand,
+        "series": list(series),
+        "condition": condition,
+        "price": list(price) if price else None,
+        "discount": list(discount) if discount else None,
+        "min_score": min_score
+    }
+
+
+class Watchlist:
+    """
+    Saved searches and the reverse index that finds, for one listing, the few searches it could satisfy.
+
+    Watches are bucketed by (kind, brand, condition), with None standing for "any", so a listing only looks at four
+    buckets. Each bucket is sorted by the low end of its price windows, and a bisect on the listing's price skips
+    every watch that asks for more; the rest are checked on price ceiling, series bitmask, discount and match score.
+    """
+
+    def __init__(self, watches=()):
+        self.watches = list(watches)
+        self.reindex()
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.watches, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def add(self, **criteria):
+        watch = make_watch(max((w["id"] for w in self.watches), default=0) + 1, **criteria)
+        self.watches.append(watch)
+        self.reindex()
+        return watch
+
+    def remove(self, watch_id):
+        kept = [w for w in self.watches if w["id"] != watch_id]
+        if len(kept) == len(self.watches):
+            raise KeyError(f"No watch with id {watch_id}")
+        self.watches = kept
+        self.reindex()
+
+    def reindex(self):
+        buckets = {}
+        for watch in self.watches:
+            low = (watch["price"] or (None, None))[0]
+            entry = (float("-inf") if low is None else low, watch["id"], watch, series_bits(watch["series"]))
+            buckets.setdefault((watch["kind"], _key(watch["brand"]), _key(watch["condition"])), []).append(entry)
+        # Per bucket: the sorted price floors, and (watch, series bits) in the same order
+        self.index = {}
+        for key, entries in buckets.items():
+            entries.sort(key=lambda entry: entry[:2])
+            self.index[key] = ([entry[0] for entry in entries], [entry[2:] for entry in entries])
+
+    def candidates(self, kind, listing):
+        """Watches whose brand, condition and price floor admit the listing."""
+        price = price_of(listing)
+        brand, condition = _key(listing.get('brand')), _key(listing.get('condition'))
+        for key in {(kind, brand, condition), (kind, brand, None), (kind, None, condition), (kind, None, None)}:
+            bucket = self.index.get(key)
+            if bucket:
+                floors, entries = bucket
+                yield from entries[:bisect_left(floors, price)]
+
+    def matching(self, kind, listing, match_score=None):
+        """
+        Watches the listing satisfies, by id. match_score(listing) is only called (once) if a candidate watch
+        sets min_score; it should return the listing's best match score against the new catalog, or None.
+        """
+        price = price_of(listing)
+        mask = series_mask(str(listing.get('title') or ''))
+        discount = None
+        score = False
+        hits = []
+        for watch, bits in self.candidates(kind, listing):
+            METRICS.count("watches_checked")
+            if not in_window(price, watch["price"]) or mask & bits != bits:
+                continue
+            if watch["discount"]:
+                if discount is None:
+                    discount = real_discount(listing)
+                if not in_window(discount, watch["discount"]):
+                    continue
+            if watch["min_score"] is not None:
+                if score is False:
+                    score = match_score(listing) if match_score else None
+                if score is None or score <= watch["min_score"]:
+                    continue
+            hits.append(watch)
+        return sorted(hits, key=lambda watch: watch["id"])
+
+
+class WatchlistRunner:
+    """
+    Evaluates the watchlist on the listings that are new since the last run (or whose price changed) and appends
+    one NDJSON notification per hit. seen_path keeps each listing's last evaluated price in cents; listings without
+    a slug or URL have no stable ID and are skipped.
+    """
+
+    def __init__(self, watchlist, seen_path, notify_path, new_guitars):
+        self.watchlist = watchlist
+        self.seen_path = seen_path
+        self.notify_path = notify_path
+        self.new_guitars = new_guitars
+        self._matcher = None
+        self.seen = {}
+        if os.path.exists(seen_path):
+            with open(seen_path, 'r', encoding='utf-8') as f:
+                self.seen = json.load(f)
+
+    def match_score(self, used):
+        if self._matcher is None:
+            with METRICS.stage("bucket"):
+                self._matcher = GuitarMatcher(bucket_by_brand(self.new_guitars))
+        matched, score = self._matcher.find_best_match(used)
+        return None if matched is None else score
+
+    def run(self, catalogs, everything=False):
+        """Check the listings of each kind in catalogs; returns the number of notifications written."""
+        found_at = int(time.time())
+        notifications = 0
+        os.makedirs(os.path.dirname(self.notify_path) or '.', exist_ok=True)
+        with open(self.notify_path, 'a', encoding='utf-8') as out_file:
+            for kind, listings in catalogs.items():
+                for listing in listings:
+                    key = listing_id(listing)
+                    if not key:
+                        continue
+                    price = to_cents(listing.get('price'))
+                    if not everything and self.seen.get(f"{kind}:{key}") == price:
+                        continue
+                    self.seen[f"{kind}:{key}"] = price
+                    METRICS.count("listings_checked")
+                    for watch in self.watchlist.matching(kind, listing, self.match_score):
+                        out_file.write(json.dumps({
+                            "watch": watch["id"],
+                            "name": watch["name"],
+                            "kind": kind,
+                            "found_at": found_at,
+                            "listing": listing
+                        }, ensure_ascii=False, default=json_default) + "\n")
+                        notifications += 1
+
+        tmp_path = self.seen_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.seen, f)
+        os.replace(tmp_path, self.seen_path)
+        return notifications
+
+
+def describe(watch):
+    parts = [watch["kind"]]
+    for field in ("brand", "condition"):
+        if watch[field]:
+            parts.append(f"{field}={watch[field]}")
+    if watch["series"]:
+        parts.append("series=" + "+".join(watch["series"]))
+    for field in ("price", "discount"):
+        if watch[field]:
+            low, high = watch[field]
+            parts.append(f"{low if low is not None else ''} < {field} < {high if high is not None else ''}")
+    if watch["min_score"] is not None:
+        parts.append(f"score > {watch['min_score']:g}")
+    return ", ".join(parts)
+
+
+def _window(values):
+    return None if values is None else tuple(None if v.lower() == "any" else float(v) for v in values)
+
+
+if __name__ == "__main__":
+    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    parser = argparse.ArgumentParser(description="Saved searches checked against newly parsed listings.")
+    parser.add_argument("--watch-dir", default=os.path.join(data_folder, "watchlists"),
+                        help="Holds watches.json, the seen-listing state and notifications.ndjson")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Save a search")
+    add.add_argument("--name")
+    add.add_argument("--kind", choices=KINDS, default="used")
+    add.add_argument("--brand")
+    add.add_argument("--series", action="append", default=[], choices=sorted(set(MODEL_SERIES)),
+                     help="MODEL_SERIES term the title must contain (repeatable)")
+    add.add_argument("--condition")
+    add.add_argument("--price", nargs=2, metavar=("LOW", "HIGH"), help="Price window; 'any' leaves a side open")
+    add.add_argument("--discount", nargs=2, metavar=("LOW", "HIGH"),
+                     help="Window on original price - price; 'any' leaves a side open")
+    add.add_argument("--min-score", type=float, help="Only used listings matching a new guitar above this score")
+    remove = commands.add_parser("remove", help="Delete a saved search")
+    remove.add_argument("watch_id", type=int)
+    commands.add_parser("list", help="Show the saved searches")
+    run = commands.add_parser("run", help="Check new or repriced listings in the combined files against every watch")
+    run.add_argument("--all", action="store_true", help="Check every listing, not only new or repriced ones")
+    args = parser.parse_args()
+
+    watches_path = os.path.join(args.watch_dir, "watches.json")
+    try:
+        watchlist = Watchlist.load(watches_path)
+
+        if args.command == "add":
+            watch = watchlist.add(name=args.name, kind=args.kind, brand=args.brand, series=args.series,
+                                  condition=args.condition, price=_window(args.price),
+                                  discount=_window(args.discount), min_score=args.min_score)
+            watchlist.save(watches_path)
+            print(f"✅ Saved watch {watch['id']}: {describe(watch)}")
+
+        elif args.command == "remove":
+            watchlist.remove(args.watch_id)
+            watchlist.save(watches_path)
+            print(f"✅ Removed watch {args.watch_id}")
+
+        elif args.command == "list":
+            for watch in watchlist.watches:
+                print(f"{watch['id']}. {watch['name']}: {describe(watch)}")
+
+        elif args.command == "run":
+            used_guitars, new_guitars = dedup_catalogs(
+                load_listings(os.path.join(data_folder, 'combined', 'used_guitars_combined.json')),
+                load_listings(os.path.join(data_folder, 'combined', 'new_guitars_combined.json'))
+            )
+            catalogs = {"used": used_guitars, "new": new_guitars}
+            notify_path = os.path.join(args.watch_dir, "notifications.ndjson")
+            runner = WatchlistRunner(watchlist, os.path.join(args.watch_dir, "seen.json"), notify_path,
+                                     catalogs["new"])
+            count = runner.run(catalogs, everything=args.all)
+            print(f"✅ {count} new watch hits written to {notify_path}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")